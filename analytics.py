@@ -0,0 +1,213 @@
+# Sales reporting: per-item daily rollups, top sellers and sell-through velocity.
+#
+# SalesAnalytics builds its rollups once from the sales history with vectorized groupbys
+# and then follows the Sales change events, folding in only the new rows. When sales are
+# partitioned, only the current month is built up front; older months are folded in, a
+# month at a time, the first time a query reaches back to them, so start-up and memory
+# follow the longest window asked for rather than the whole history. Queries read the
+# rollups, so their cost depends on the size of the answer rather than on the history.
+import bisect
+import heapq
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from instrumentation import timed
+from schema import DATE_FORMAT, format_dates
+from storage import current_month
+
+OPEN_WINDOWS_KEPT = 8  # Windows up to the latest sale whose per-item totals are kept running
+
+
+class SalesAnalytics:
+    def __init__(self, sales):
+        self.sales = sales
+        self._days = {}  # date -> {item ID: units sold}
+        self._dates = []  # sorted dates with sales
+        self._day_totals = {}  # date -> units sold
+        # Per item, sorted dates with sales and the running total of units up to each date
+        self._item_dates = {}
+        self._item_cumulative = {}
+        self.names = {}  # item ID -> latest item name
+        # First month of partitioned history in the rollups; None once they hold all of it
+        self._since = None
+        # start date (or None) -> {item ID: units sold from then on}, for the windows asked
+        # for lately, updated with every sale so the reports don't add up days again
+        self._open_totals = {}
+        self.build()
+        sales.subscribe(self.on_sales_changed)
+
+    @timed
+    def build(self):
+        self._days.clear()
+        self._day_totals.clear()
+        self._item_dates.clear()
+        self._item_cumulative.clear()
+        self.names.clear()
+        self._open_totals.clear()
+        self._since = None if self.sales.months() is None else current_month()
+        # Partitioned history comes a month at a time, in date order and never sharing a date
+        for sales_data in self.sales.history_chunks(self._since):
+            if not sales_data.empty:
+                self._add_chunk(sales_data)
+        self._dates = sorted(self._days)
+
+    def _cover(self, start):
+        # Folds in the partitioned months before the ones built so far, back to the month of
+        # start (YYYY-MM-DD, or None for the whole history). The older months are rolled up
+        # by themselves, oldest first, and the per-item rollups built so far follow on.
+        if self._since is None or (start and start[:7] >= self._since):
+            return
+        item_dates, item_cumulative, names = self._item_dates, self._item_cumulative, self.names
+        self._item_dates, self._item_cumulative, self.names = {}, {}, {}
+        for sales_data in self.sales.history_chunks(start[:7] if start else None, self._since):
+            if not sales_data.empty:
+                self._add_chunk(sales_data)
+        for item_id, dates in item_dates.items():
+            previous = self._item_cumulative.get(item_id)
+            offset = previous[-1] if previous else 0
+            self._item_dates.setdefault(item_id, []).extend(dates)
+            self._item_cumulative.setdefault(item_id, []).extend(units + offset for units in item_cumulative[item_id])
+        # The newest names win
+        self.names.update(names)
+        self._since = start[:7] if start else None
+        self._dates = sorted(self._days)
+
+    def _add_chunk(self, sales_data):
+        quantities = sales_data['Quantity'].astype(int)
+        days = sales_data['Timestamp'].dt.floor('D').rename('Date')
+        # observed=True: only combinations that occur, also when the columns are categorical
+        rollup = quantities.groupby([sales_data['Item ID'], days], observed=True).sum()
+        item_ids = rollup.index.get_level_values('Item ID').astype(str).tolist()
+        dates = format_dates(rollup.index.get_level_values('Date')).tolist()
+        # The same entries ordered by date, so each day's dict is filled in one update
+        day_values = rollup.index.get_level_values('Date').to_numpy()
+        order = np.argsort(day_values, kind='stable')
+        sorted_days = day_values[order]
+        day_starts = np.flatnonzero(np.r_[True, sorted_days[1:] != sorted_days[:-1]]).tolist() + [len(order)]
+        ids_by_day = np.asarray(item_ids, dtype=object)[order].tolist()
+        units_by_day = rollup.to_numpy()[order].tolist()
+        for start, end in zip(day_starts, day_starts[1:]):
+            date = dates[order[start]]
+            day = self._days.setdefault(date, {})
+            day.update(zip(ids_by_day[start:end], units_by_day[start:end]))
+            self._day_totals[date] = sum(day.values())
+
+        # rollup is sorted by item and then date, so each item's dates are a sorted run that
+        # follows on from the item's earlier chunks
+        boundaries = [0] + (np.flatnonzero(np.diff(rollup.index.codes[0])) + 1).tolist() + [len(item_ids)]
+        runs = [item_ids[start] for start in boundaries[:-1]]
+        # Each item's running total carries on from its earlier chunks
+        offsets = [self._item_cumulative[item_id][-1] if item_id in self._item_cumulative else 0 for item_id in runs]
+        cumulative = rollup.groupby(level='Item ID', observed=True).cumsum().to_numpy()
+        cumulative = (cumulative + np.repeat(offsets, np.diff(boundaries))).tolist()
+        for item_id, start, end in zip(runs, boundaries, boundaries[1:]):
+            item_dates = self._item_dates.get(item_id)
+            if item_dates is None:
+                self._item_dates[item_id] = dates[start:end]
+                self._item_cumulative[item_id] = cumulative[start:end]
+            else:
+                item_dates.extend(dates[start:end])
+                self._item_cumulative[item_id].extend(cumulative[start:end])
+        self.names.update((str(item_id), name) for item_id, name in
+                          sales_data.groupby('Item ID', observed=True)['Item Name'].last().items())
+
+    @timed
+    def on_sales_changed(self, event):
+        if event.removed:
+            self.build()
+            return
+        sales_data = self.sales.sales_data
+        columns = [sales_data.columns.get_loc(column) for column in ('Item ID', 'Item Name', 'Quantity', 'Timestamp')]
+        for row in event.inserted:
+            item_id, name, quantity, timestamp = (sales_data.iat[row, column] for column in columns)
+            self.add_sale(item_id, name, int(quantity), timestamp.strftime(DATE_FORMAT))
+
+    def add_sale(self, item_id, name, quantity, date):
+        day = self._days.get(date)
+        if day is None:
+            day = self._days[date] = {}
+            bisect.insort(self._dates, date)
+        day[item_id] = day.get(item_id, 0) + quantity
+        self._day_totals[date] = self._day_totals.get(date, 0) + quantity
+        self.names[item_id] = name
+        for start, totals in self._open_totals.items():
+            if start is None or date >= start:
+                totals[item_id] = totals.get(item_id, 0) + quantity
+
+        dates = self._item_dates.setdefault(item_id, [])
+        cumulative = self._item_cumulative.setdefault(item_id, [])
+        position = bisect.bisect_left(dates, date)
+        if position == len(dates) or dates[position] != date:
+            # New sales are almost always today's, so this is normally an append
+            dates.insert(position, date)
+            cumulative.insert(position, cumulative[position - 1] if position else 0)
+        for i in range(position, len(cumulative)):
+            cumulative[i] += quantity
+
+    def _window(self, start, end):
+        # Dates with sales in [start, end]; either bound may be left open
+        self._cover(start)
+        low = bisect.bisect_left(self._dates, start) if start else 0
+        high = bisect.bisect_right(self._dates, end) if end else len(self._dates)
+        return self._dates[low:high]
+
+    def daily_totals(self, start=None, end=None):
+        # [(date, units sold)] for days with sales between start and end (YYYY-MM-DD)
+        return [(date, self._day_totals[date]) for date in self._window(start, end)]
+
+    def item_daily(self, item_id, start=None, end=None):
+        return [(date, self._days[date][item_id]) for date in self._window(start, end)
+                if item_id in self._days[date]]
+
+    def units_by_item(self, start=None, end=None):
+        # {item ID: units sold} for the items with sales between start and end. Windows that
+        # reach the latest sale are kept as running totals, so asking again costs the size
+        # of the answer rather than a pass over every day in the window.
+        if end and self._dates and end < self._dates[-1]:
+            return self._sum_days(start, end)
+        totals = self._open_totals.get(start)
+        if totals is None:
+            if len(self._open_totals) >= OPEN_WINDOWS_KEPT:
+                del self._open_totals[next(iter(self._open_totals))]
+            totals = self._open_totals[start] = self._sum_days(start, None)
+        return dict(totals)
+
+    def _sum_days(self, start, end):
+        totals = {}
+        for date in self._window(start, end):
+            for item_id, units in self._days[date].items():
+                totals[item_id] = totals.get(item_id, 0) + units
+        return totals
+
+    def top_sellers(self, n=10, start=None, end=None):
+        # [(item ID, item name, units sold)] for the n best sellers between start and end
+        totals = self.units_by_item(start, end)
+        best = heapq.nlargest(n, totals.items(), key=lambda item: (item[1], item[0]))
+        return [(item_id, self.names.get(item_id, ""), units) for item_id, units in best]
+
+    def units_sold(self, item_id, start=None, end=None):
+        self._cover(start)
+        dates = self._item_dates.get(item_id)
+        if not dates:
+            return 0
+        cumulative = self._item_cumulative[item_id]
+        high = bisect.bisect_right(dates, end) if end else len(dates)
+        low = bisect.bisect_left(dates, start) if start else 0
+        if high <= low:
+            return 0
+        return cumulative[high - 1] - (cumulative[low - 1] if low else 0)
+
+    def velocity(self, item_id, days=30, today=None):
+        # Average units sold per day over the last `days` days, today included
+        today = today or datetime.now().date()
+        start = (today - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        return self.units_sold(item_id, start, today.strftime('%Y-%m-%d')) / days
+
+    def sell_through(self, item_id, on_hand, days=30, today=None):
+        # Share of the stock available over the window that was sold: sold / (sold + on hand)
+        today = today or datetime.now().date()
+        start = (today - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        sold = self.units_sold(item_id, start, today.strftime('%Y-%m-%d'))
+        available = sold + on_hand
+        return sold / available if available else 0.0
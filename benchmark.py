@@ -0,0 +1,285 @@
+# Benchmarks for the inventory and sales models on generated data.
+#
+# Each dataset (number of SKUs and sales rows) is generated from a fixed seed into its own
+# working directory and benchmarked in a fresh process, so peak memory is per dataset.
+# The models run headlessly (no Tk window). Every operation is timed call by call and
+# reported as latency percentiles; results are written as JSON, and --compare prints the
+# change against an earlier results file.
+#
+#   python benchmark.py                          # 1k SKUs, 10k sales
+#   python benchmark.py --preset large           # 1M SKUs, 10M sales
+#   python benchmark.py --skus 100000 --sales 2000000 --output after.json --compare before.json
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+PRESETS = {
+    "small": [(1000, 10000)],
+    "medium": [(100000, 1000000)],
+    "large": [(1000000, 10000000)],
+    "all": [(1000, 10000), (100000, 1000000), (1000000, 10000000)],
+}
+SALES_CHUNK = 1000000  # Sales rows generated and written at a time
+SALES_DAYS = 365  # Generated sales cover this many days up to today
+
+WORDS = ["Amoxicillin", "Ibuprofen", "Paracetamol", "Metformin", "Omeprazole", "Cetirizine", "Loratadine",
+         "Atorvastatin", "Amlodipine", "Lisinopril", "Salbutamol", "Prednisolone", "Azithromycin", "Ciprofloxacin",
+         "Diclofenac", "Naproxen", "Ranitidine", "Simvastatin", "Losartan", "Furosemide", "Insulin", "Vitamin",
+         "Zinc", "Iron", "Calcium", "Folic", "Aspirin", "Codeine", "Tramadol", "Doxycycline"]
+FORMS = ["Tablets", "Capsules", "Syrup", "Drops", "Cream", "Gel", "Injection", "Inhaler", "Sachets", "Spray"]
+STRENGTHS = ["5mg", "10mg", "20mg", "50mg", "100mg", "250mg", "500mg", "1g"]
+
+
+def generate_inventory(skus, rng):
+    today = datetime.now().date()
+    names = (pd.Series(rng.choice(WORDS, skus)) + " " + pd.Series(rng.choice(STRENGTHS, skus)) + " "
+             + pd.Series(rng.choice(FORMS, skus)))
+    # Some already expired, most expire within two years
+    expiry = pd.Series(pd.to_datetime(today) + pd.to_timedelta(rng.integers(-60, 730, skus), unit="D"))
+    return pd.DataFrame({
+        "ID": pd.Series(np.arange(1, skus + 1)).astype(str).str.zfill(7),
+        "Name": names,
+        "Quantity": rng.integers(1, 500, skus),
+        "Expiration Date": expiry.dt.strftime("%Y-%m-%d"),
+    })
+
+
+def write_sales(path, inventory, rows, rng):
+    # Written a chunk at a time in date order, so 10M rows never have to be in memory
+    start = pd.Timestamp(datetime.now().date() - timedelta(days=SALES_DAYS - 1))
+    written = 0
+    with open(path, "w", newline="") as sales_file:
+        while written < rows:
+            count = min(SALES_CHUNK, rows - written)
+            first_day = written * SALES_DAYS // rows
+            last_day = (written + count) * SALES_DAYS // rows
+            picks = rng.integers(0, len(inventory), count)
+            days = np.sort(rng.integers(first_day, max(last_day, first_day + 1), count))
+            seconds = rng.integers(8 * 3600, 22 * 3600, count)
+            stamps = start + pd.to_timedelta(days, unit="D") + pd.to_timedelta(seconds, unit="s")
+            chunk = pd.DataFrame({
+                "Item ID": inventory["ID"].to_numpy()[picks],
+                "Item Name": inventory["Name"].to_numpy()[picks],
+                "Quantity": rng.integers(1, 6, count),
+                "Date": stamps.strftime("%Y-%m-%d"),
+                "Time": stamps.strftime("%H:%M:%S"),
+            })
+            chunk.to_csv(sales_file, index=False, header=written == 0)
+            written += count
+
+
+def summarize(latencies):
+    values = np.asarray(latencies) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": round(float(values.mean()), 4),
+        "p50_ms": round(float(np.percentile(values, 50)), 4),
+        "p90_ms": round(float(np.percentile(values, 90)), 4),
+        "p99_ms": round(float(np.percentile(values, 99)), 4),
+        "max_ms": round(float(values.max()), 4),
+    }
+
+
+def timed(function, calls):
+    # Runs function(i) for each call and returns the latencies in seconds
+    latencies = []
+    for i in range(calls):
+        started = time.perf_counter()
+        function(i)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_dataset(skus, sales_rows, seed, repeat, workdir, write_behind):
+    # Runs in its own process; everything happens inside workdir
+    os.chdir(workdir)
+    import models
+    # load_models reads these; the benchmark always runs the local models
+    models.USE_SERVICE = False
+    models.WRITE_BEHIND = write_behind
+
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+    inventory_data = generate_inventory(skus, rng)
+    inventory_data.to_csv(models.INVENTORY_FILE, index=False)
+    write_sales(models.SALES_FILE, inventory_data, sales_rows, rng)
+    # Converts the files to the configured layout (e.g. monthly partitions) up front
+    models.create_storage().close()
+    prepare_seconds = time.perf_counter() - started
+
+    results = {}
+
+    def load(i):
+        # Everything the app builds before its window opens: models, analytics and forecast
+        storage = models.load_models()[0]
+        storage.close()
+
+    results["load"] = summarize(timed(load, max(1, min(repeat, 5))))
+    tracemalloc.start()
+    storage, inventory, sales, _, _ = models.load_models()
+    load_traced_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    # Size of the loaded frames themselves, strings included
+    frames_mb = (inventory.data.memory_usage(deep=True).sum() + sales.sales_data.memory_usage(deep=True).sum()) / 2 ** 20
+
+    ids = inventory_data["ID"].to_numpy()
+    names = inventory_data["Name"].to_numpy()
+    picks = rng.integers(0, skus, repeat)
+    terms = []
+    for i, pick in enumerate(picks):
+        # A mix of ID prefixes, name prefixes and substrings, as typed into the search box
+        kind = i % 3
+        if kind == 0:
+            terms.append(ids[pick][:5])
+        elif kind == 1:
+            terms.append(names[pick][:4])
+        else:
+            word = names[pick].split()[0]
+            terms.append(word[2:6])
+
+    results["search_inventory"] = summarize(timed(lambda i: inventory.search_inventory(terms[i], 1000), repeat))
+    results["check_expirations"] = summarize(timed(lambda i: inventory.check_expirations(30), repeat))
+    results["edit_item"] = summarize(timed(
+        lambda i: inventory.edit_item(ids[picks[i]], quantity=int(rng.integers(1, 500))), repeat))
+    results["add_item"] = summarize(timed(
+        lambda i: inventory.add_item(f"NEW{i:07d}", "Benchmark Item", 100, "2030-01-01"), repeat))
+    results["record_sale"] = summarize(timed(
+        lambda i: sales.record_sale(ids[picks[i]], names[picks[i]], 1), repeat))
+    results["record_sales_batch"] = summarize(timed(
+        lambda i: sales.record_sales_batch(inventory, [(ids[picks[i]], 1), (ids[picks[-i - 1]], 1)]), repeat))
+    results["delete_item"] = summarize(timed(lambda i: inventory.delete_item(f"NEW{i:07d}"), repeat))
+
+    def save(i):
+        inventory.save_inventory()
+        sales.save_sales()
+        if getattr(storage, "writer", None) is not None:
+            storage.writer.flush()
+
+    results["save"] = summarize(timed(save, max(1, min(repeat, 5))))
+    storage.close()
+
+    return {
+        "skus": skus,
+        "sales": sales_rows,
+        "prepare_seconds": round(prepare_seconds, 2),
+        "load_traced_peak_mb": round(load_traced_mb, 1),
+        "frames_mb": round(float(frames_mb), 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(report):
+    for dataset in report["datasets"]:
+        print(f"\n{dataset['skus']} SKUs, {dataset['sales']} sales: load peak {dataset['load_traced_peak_mb']} MB "
+              f"traced, {dataset['peak_rss_mb']} MB RSS, frames {dataset.get('frames_mb')} MB")
+        print(f"  {'operation':<20}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for operation, stats in dataset["results"].items():
+            print(f"  {operation:<20}{stats['p50_ms']:>10.3f}{stats['p90_ms']:>10.3f}"
+                  f"{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}")
+
+
+def compare(report, baseline):
+    # Prints the p50/p99 change of each operation against a baseline with the same dataset
+    previous = {(dataset["skus"], dataset["sales"]): dataset for dataset in baseline["datasets"]}
+    for dataset in report["datasets"]:
+        old = previous.get((dataset["skus"], dataset["sales"]))
+        if old is None:
+            continue
+        print(f"\n{dataset['skus']} SKUs, {dataset['sales']} sales vs {baseline.get('revision') or 'baseline'}:")
+        for operation, stats in dataset["results"].items():
+            old_stats = old["results"].get(operation)
+            if not old_stats:
+                continue
+            changes = []
+            for key in ("p50_ms", "p99_ms"):
+                if old_stats[key]:
+                    changes.append(f"{key[:3]} {100 * (stats[key] / old_stats[key] - 1):+.1f}%")
+            print(f"  {operation:<20}{'  '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pharmacy models on generated data.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--skus", type=int, help="number of SKUs (overrides the preset)")
+    parser.add_argument("--sales", type=int, help="number of sales rows (with --skus; default 10 per SKU)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=200, help="calls timed per operation")
+    parser.add_argument("--write-behind", action="store_true", help="save on the background writer like the app")
+    parser.add_argument("--workdir", help="keep the generated files here instead of a temporary directory")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="an earlier results file to compare against")
+    args = parser.parse_args()
+
+    datasets = PRESETS[args.preset]
+    if args.skus:
+        datasets = [(args.skus, args.sales if args.sales is not None else 10 * args.skus)]
+
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "write_behind": args.write_behind,
+        "datasets": [],
+    }
+    for skus, sales_rows in datasets:
+        workdir = os.path.abspath(os.path.join(args.workdir, f"{skus}_{sales_rows}")) if args.workdir else tempfile.mkdtemp()
+        os.makedirs(workdir, exist_ok=True)
+        try:
+            # A fresh process per dataset, so peak memory isn't carried over from the last one
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn"), initializer=sys.path.insert,
+                                     initargs=(0, package_dir)) as pool:
+                dataset = pool.submit(run_dataset, skus, sales_rows, args.seed, args.repeat, workdir,
+                                      args.write_behind).result()
+        finally:
+            if not args.workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+        report["datasets"].append(dataset)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_results(report)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Stock-out forecasting and reorder suggestions for the whole catalogue.
+#
+# Each item's demand is its average units sold per day over the last DEMAND_WINDOW_DAYS,
+# taken from the SalesAnalytics rollups. StockForecast keeps demand and stock on hand in
+# numpy arrays aligned with the inventory rows, so days until stock-out and reorder points
+# for every item come from a few array operations. Sales and stock changes update just
+# the entries they touch; the window is recomputed when the day changes.
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+DEMAND_WINDOW_DAYS = 30  # Sales history the demand rate is averaged over
+LEAD_TIME_DAYS = 7  # Days from placing an order to the stock arriving
+SAFETY_DAYS = 3  # Extra days of demand kept as safety stock
+ORDER_COVER_DAYS = 14  # Days of demand an order should cover beyond the reorder point
+
+FORECAST_COLUMNS = ["ID", "Name", "Quantity", "Units/Day", "Days Left", "Stock-Out Date", "Reorder Point",
+                    "Order Quantity"]
+
+
+class StockForecast:
+    def __init__(self, inventory, analytics, window_days=DEMAND_WINDOW_DAYS, lead_time_days=LEAD_TIME_DAYS,
+                 safety_days=SAFETY_DAYS, cover_days=ORDER_COVER_DAYS):
+        self.inventory = inventory
+        self.analytics = analytics
+        self.window_days = window_days
+        self.lead_time_days = lead_time_days
+        self.safety_days = safety_days
+        self.cover_days = cover_days
+        self.build()
+        inventory.subscribe(self.on_inventory_changed)
+        analytics.sales.subscribe(self.on_sales_changed)
+
+    @timed
+    def build(self, today=None):
+        self.today = today or datetime.now().date()
+        self.start = (self.today - timedelta(days=self.window_days - 1)).strftime('%Y-%m-%d')
+        sold = self.analytics.units_by_item(self.start, self.today.strftime('%Y-%m-%d'))
+        data = self.inventory.get_inventory()
+        # Both aligned with the inventory rows
+        self.quantities = data['Quantity'].to_numpy().astype(float)
+        self.demand = (pd.Series(sold, dtype=float).reindex(data['ID'].to_numpy(), fill_value=0.0).to_numpy()
+                       / self.window_days)
+
+    @timed
+    def on_sales_changed(self, event):
+        if event.removed or datetime.now().date() != self.today:
+            # History reloaded, or the window has moved on a day
+            self.build()
+            return
+        sales_data = self.analytics.sales.sales_data
+        data = self.inventory.get_inventory()
+        columns = [sales_data.columns.get_loc(column) for column in ('Item ID', 'Quantity', 'Timestamp')]
+        start = pd.Timestamp(self.start)
+        for row in event.inserted:
+            item_id, quantity, timestamp = (sales_data.iat[row, column] for column in columns)
+            label = self.inventory.label_of(item_id)
+            if label is not None and timestamp >= start:
+                self.demand[data.index.get_loc(label)] += int(quantity) / self.window_days
+
+    @timed
+    def on_inventory_changed(self, event):
+        if event.inserted or event.removed:
+            # Rows moved; line the arrays up with the inventory again
+            self.build(self.today)
+            return
+        if event.updated:
+            positions = np.asarray(event.updated)
+            self.quantities[positions] = self.inventory.get_inventory()['Quantity'].to_numpy()[positions]
+
+    def days_left(self):
+        # Days until each item runs out at its current demand; inf for items not selling
+        with np.errstate(divide='ignore'):
+            return np.where(self.demand > 0, self.quantities / self.demand, np.inf)
+
+    def reorder_points(self):
+        # Stock that lasts through the lead time plus the safety days
+        return self.demand * (self.lead_time_days + self.safety_days)
+
+    def forecast(self, positions):
+        # FORECAST_COLUMNS for the inventory rows at `positions`
+        data = self.inventory.get_inventory()
+        demand = self.demand[positions]
+        quantities = self.quantities[positions]
+        days_left = self.days_left()[positions]
+        reorder_points = self.reorder_points()[positions]
+        order_up_to = demand * (self.lead_time_days + self.safety_days + self.cover_days)
+        stock_out = pd.Series(pd.to_datetime(self.today) + pd.to_timedelta(
+            np.where(np.isfinite(days_left), np.floor(days_left), np.nan), unit='D'))
+        return pd.DataFrame({
+            'ID': data['ID'].to_numpy()[positions],
+            'Name': data['Name'].to_numpy()[positions],
+            'Quantity': quantities.astype(int),
+            'Units/Day': demand.round(2),
+            'Days Left': days_left.round(1),
+            'Stock-Out Date': stock_out.dt.strftime('%Y-%m-%d').to_numpy(),
+            'Reorder Point': np.ceil(reorder_points).astype(int),
+            'Order Quantity': np.maximum(np.ceil(order_up_to - quantities), 0).astype(int),
+        }, columns=FORECAST_COLUMNS)
+
+    @timed
+    def reorder_suggestions(self, limit=None):
+        # Items selling at or below their reorder point, soonest stock-out first
+        due = np.flatnonzero((self.demand > 0) & (self.quantities <= self.reorder_points()))
+        due = due[np.argsort(self.days_left()[due], kind='stable')]
+        return self.forecast(due[:limit])
@@ -0,0 +1,121 @@
+# Operation timing and profiling.
+#
+# Methods decorated with @timed record how long each call took under their qualified name
+# (e.g. "Inventory.search_inventory"). The last TIMING_WINDOW calls of each operation are
+# kept for percentiles and a latency histogram, and calls slower than SLOW_OPERATION_MS are
+# logged as warnings on the "pharmacy" logger. Profiler wraps cProfile so a capture can be
+# switched on and off while the app runs.
+import cProfile
+import functools
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+TIMING_WINDOW = 1000  # Calls kept per operation
+SLOW_OPERATION_MS = 100  # Calls slower than this are logged
+# Upper edges of the histogram buckets, in milliseconds; the last bucket is open-ended
+HISTOGRAM_EDGES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+log = logging.getLogger("pharmacy")
+
+
+class Timings:
+    def __init__(self, window=TIMING_WINDOW, slow_ms=SLOW_OPERATION_MS):
+        self.window = window
+        self.slow_ms = slow_ms
+        self._calls = {}  # operation -> deque of recent durations in seconds
+        self._totals = {}  # operation -> calls since start (or reset)
+        # Storage writes are timed on the background writer thread
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            calls = self._calls.get(name)
+            if calls is None:
+                calls = self._calls[name] = deque(maxlen=self.window)
+            calls.append(seconds)
+            self._totals[name] = self._totals.get(name, 0) + 1
+        if seconds * 1000 > self.slow_ms:
+            log.warning("%s took %.1f ms", name, seconds * 1000)
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._totals.clear()
+
+    def stats(self):
+        # {operation: {calls, mean/p50/p90/p99/max in ms, histogram}} over the recent calls
+        with self._lock:
+            snapshot = {name: (np.array(calls) * 1000, self._totals[name]) for name, calls in self._calls.items()}
+        stats = {}
+        for name, (durations, total) in sorted(snapshot.items()):
+            counts = np.bincount(np.searchsorted(HISTOGRAM_EDGES_MS, durations), minlength=len(HISTOGRAM_EDGES_MS) + 1)
+            labels = [f"<={edge}ms" for edge in HISTOGRAM_EDGES_MS] + [f">{HISTOGRAM_EDGES_MS[-1]}ms"]
+            stats[name] = {
+                "calls": total,
+                "mean_ms": round(float(durations.mean()), 3),
+                "p50_ms": round(float(np.percentile(durations, 50)), 3),
+                "p90_ms": round(float(np.percentile(durations, 90)), 3),
+                "p99_ms": round(float(np.percentile(durations, 99)), 3),
+                "max_ms": round(float(durations.max()), 3),
+                "histogram": {label: int(count) for label, count in zip(labels, counts) if count},
+            }
+        return stats
+
+    def report(self):
+        lines = [f"{'operation':<40}{'calls':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, stats in self.stats().items():
+            lines.append(f"{name:<40}{stats['calls']:>8}{stats['p50_ms']:>10.2f}{stats['p90_ms']:>10.2f}"
+                         f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.stats(), f, indent=2)
+
+
+timings = Timings()
+
+
+def timed(function):
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings.record(name, time.perf_counter() - started)
+    return wrapper
+
+
+class Profiler:
+    # cProfile capture of the UI thread, started and stopped on demand
+    def __init__(self):
+        self._profile = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self):
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self, path=None, top=30):
+        # Ends the capture, saves it to `path` (for snakeviz, pstats, ...) if given, and
+        # returns the `top` functions by cumulative time as text
+        self._profile.disable()
+        profile, self._profile = self._profile, None
+        if path:
+            profile.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(top)
+        return output.getvalue()
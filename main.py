@@ -1,172 +1,402 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 from ttkthemes import ThemedTk
-import tkinter.font as tkfont
 import pandas as pd
-from datetime import datetime
-import os
-
-# Configurable default usernames and passwords
-DEFAULT_USERS = {
-    "admin": "admin",
-    "staff": "staff"
-}
-
-INVENTORY_FILE = "inventory.csv"
-SALES_FILE = "sales.csv"
-
-
-class Inventory:
-    def __init__(self):
-        self.load_inventory()
-
-    def load_inventory(self):
-        if os.path.exists(INVENTORY_FILE):
-            self.data = pd.read_csv(INVENTORY_FILE)
-        else:
-            self.data = pd.DataFrame(columns=["ID", "Name", "Quantity", "Expiration Date"])
-
-    def save_inventory(self):
-        self.data.to_csv(INVENTORY_FILE, index=False)
-
-    def add_item(self, item_id, name, quantity, expiration_date):
-        # Check if item with the same ID already exists
-        if item_id in self.data['ID'].values:
-            return False, "An item with this ID already exists."
-
-        # Convert the expiration_date to datetime and then back to string in YYYY-MM-DD format
+from datetime import datetime, timedelta
+
+from instrumentation import Profiler, log, timed, timings
+from models import EXPIRY_WARNING_DAYS, SHARED_FILES, USE_SERVICE, ExpiryIndex, load_models
+from startup import configure_root, configure_styles, create_login
+from schema import DATE_FORMAT, INVENTORY_COLUMNS, TIME_FORMAT
+from users import UserManager
+
+# Storage, write-behind and service settings are in models.py
+
+# The save status is refreshed every SAVE_STATUS_INTERVAL_MS
+SAVE_STATUS_INTERVAL_MS = 500
+# With SHARED_FILES, each instance checks every FILE_POLL_MS for what the others wrote
+FILE_POLL_MS = 2000
+# Admin > Dump Timing Stats writes TIMING_DUMP_FILE; a profiling capture is saved to PROFILE_FILE
+TIMING_DUMP_FILE = "timings.json"
+PROFILE_FILE = "pharmacy.prof"
+# With USE_SERVICE, tills pick up each other's changes every SERVICE_POLL_MS
+SERVICE_POLL_MS = 1000
+# Report windows offered on the Reports tab (days), and how many top sellers to list
+REPORT_WINDOWS = ("7", "30", "90", "365")
+REPORT_TOP_SELLERS = 10
+# Reorder suggestions listed on the Reports tab (see forecast.py for the forecast settings)
+REPORT_REORDER_ROWS = 50
+# Rows kept in a list view above and below the visible window
+VIRTUAL_BUFFER_ROWS = 50
+# Live search runs this long after the last keystroke, and shows at most this many results
+SEARCH_DEBOUNCE_MS = 150
+SEARCH_RESULT_LIMIT = 1000
+# Expiry alerts (for items within EXPIRY_WARNING_DAYS) are re-checked every
+# EXPIRY_CHECK_INTERVAL_MS and shown EXPIRY_ALERT_PAGE_SIZE at a time
+EXPIRY_CHECK_INTERVAL_MS = 60 * 60 * 1000
+EXPIRY_ALERT_PAGE_SIZE = 20
+
+
+class VirtualTreeview:
+    # Shows a large frame in a ttk.Treeview while only materializing the rows in the
+    # visible window plus a small buffer. The scrollbar is driven from here, so it
+    # reflects the whole frame rather than the rows that happen to be in the tree.
+    # columns are frame columns, or (frame column, strftime format) pairs for datetime
+    # columns shown differently or in more than one tree column, like a sale's date and time.
+    def __init__(self, tree, scrollbar, columns, on_select=None, buffer_rows=VIRTUAL_BUFFER_ROWS):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.columns = list(columns)
+        self.on_select = on_select
+        self.buffer_rows = buffer_rows
+
+        self._arrays = [[] for _ in self.columns]
+        self._keys = None
+        self._rows = 0
+        self._start = 0  # Materialized rows are [_start, _end)
+        self._end = 0
+        self.first = 0  # Index of the top visible row
+        self._selected = ()
+        self._rendered_selection = ()
+
+        self.scrollbar.configure(command=self.yview)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        self.tree.bind("<Configure>", lambda event: self.render())
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+
+    def set_data(self, data, keys=None):
+        # keys gives a stable iid per row (e.g. the item ID); rows are numbered otherwise
+        self._use_data(data, keys)
+        self._rows = len(data)
+        self.first = max(0, min(self.first, self._rows - self.visible_rows()))
+        self.render()
+
+    def _use_data(self, data, keys):
+        # Runs on every change event, so nothing here may copy the frame's columns: keys
+        # and readers work on the frame's own arrays and see changes made in place
+        self._data = data
+        self._arrays = None  # Column readers are set up when first needed
+        self._keys = None if keys is None else keys.array
+
+    def key(self, row):
+        return str(self._keys[row]) if self._keys is not None else str(row)
+
+    def row_values(self, row):
+        if self._arrays is None:
+            self._arrays = [self._column_reader(self._data[column], DATE_FORMAT) if isinstance(column, str)
+                            else self._column_reader(self._data[column[0]], column[1]) for column in self.columns]
+        return [read(row) for read in self._arrays]
+
+    @staticmethod
+    def _column_reader(series, date_format):
+        # Categorical columns are read through their codes, so they are never expanded
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.array.codes
+            categories = series.cat.categories.array
+            return lambda row: categories[codes[row]] if codes[row] >= 0 else ""
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            values = series.to_numpy()  # A view of the column, not a copy
+            # Only the rows on screen are formatted
+            return lambda row: "" if pd.isna(values[row]) else pd.Timestamp(values[row]).strftime(date_format)
+        return series.array.__getitem__
+
+    def apply_changes(self, data, event, keys=None):
+        # Patch the materialized rows for a ChangeEvent instead of re-rendering, so the
+        # selection and scroll position are left alone
+        visible = self.visible_rows()
+        # Keys are looked up before the new frame is taken on, while they still name the rows
+        removed = {self.key(row) for row in event.removed}
+        if removed.intersection(self._selected):
+            self._selected = tuple(key for key in self._selected if key not in removed)
+        for row in sorted(event.removed, reverse=True):
+            if row < self._start:
+                self._start -= 1
+                self._end -= 1
+                self.first -= 1
+            elif row < self._end:
+                self.tree.delete(self.key(row))
+                self._end -= 1
+            self._rows -= 1
+
+        self._use_data(data, keys)
+        for row in event.updated:
+            if self._start <= row < self._end:
+                self.tree.item(self.key(row), values=self.row_values(row))
+
+        for row in sorted(event.inserted):
+            self._rows += 1
+            if row < self._start:
+                self._start += 1
+                self._end += 1
+                self.first += 1
+            elif row <= self._end and (row < self._end or self._end < self.first + visible + self.buffer_rows):
+                self.tree.insert("", row - self._start, iid=self.key(row), values=self.row_values(row))
+                self._end += 1
+
+        # Top the window back up after removals near the end
+        while self._end < min(self._rows, self.first + visible + self.buffer_rows):
+            self.tree.insert("", "end", iid=self.key(self._end), values=self.row_values(self._end))
+            self._end += 1
+
+        self.first = max(0, min(self.first, self._rows - visible))
+        self._rendered_selection = tuple(self.tree.selection())
+        self._move_tree_view()
+        self._update_scrollbar()
+
+    def selection(self):
+        # Selected keys, including rows that are currently scrolled out of the tree
+        return self._selected
+
+    def visible_rows(self):
         try:
-            date_obj = pd.to_datetime(expiration_date).date()
-            formatted_date = date_obj.strftime('%Y-%m-%d')
-        except ValueError:
-            return False, "Invalid date format. Use YYYY-MM-DD."
-
-        new_item = pd.DataFrame([[item_id, name, quantity, formatted_date]], columns=self.data.columns)
-        self.data = pd.concat([self.data, new_item], ignore_index=True)
-        self.save_inventory()
-        return True, "Item added successfully."
-
-    def edit_item(self, item_id, quantity=None, expiration_date=None):
-        item_id = str(item_id).strip()
-        self.data['ID'] = self.data['ID'].astype(str).str.strip()
-        
-        if item_id in self.data['ID'].values:
-            if quantity is not None:
-                self.data.loc[self.data['ID'] == item_id, 'Quantity'] = quantity
-            if expiration_date is not None:
-                # Ensure the expiration date is in YYYY-MM-DD format
-                try:
-                    date_obj = pd.to_datetime(expiration_date).date()
-                    formatted_date = date_obj.strftime('%Y-%m-%d')
-                    self.data.loc[self.data['ID'] == item_id, 'Expiration Date'] = formatted_date
-                except ValueError:
-                    return False, "Invalid date format. Use YYYY-MM-DD."
-            self.save_inventory()
-            return True, "Item updated successfully."
-        return False, "Item not found."
-
-    def delete_item(self, item_id):
-        self.data = self.data[self.data['ID'] != item_id]
-        self.save_inventory()
-
-    def get_inventory(self):
-        return self.data
-
-    def search_inventory(self, search_term):
-        # Filter the inventory based on the search term
-        filtered_data = self.data[
-            self.data['ID'].astype(str).str.contains(search_term, case=False) |
-            self.data['Name'].str.contains(search_term, case=False)
-        ]
-        return filtered_data
-
-    def check_expirations(self):
-        today = pd.Timestamp.now()
-        thirty_days = pd.Timedelta(days=30)
-        
-        # Convert expiration dates to datetime
-        self.data['Expiration Date'] = pd.to_datetime(self.data['Expiration Date'])
-        
-        # Filter items expiring within 30 days
-        expiring_items = self.data[
-            (self.data['Expiration Date'] - today) <= thirty_days
-        ]
-        
-        return expiring_items
-class Sales:
-    def __init__(self):
-        self.load_sales()
-
-    def load_sales(self):
-        if os.path.exists(SALES_FILE):
-            self.sales_data = pd.read_csv(SALES_FILE)
+            row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        except (tk.TclError, ValueError):
+            row_height = 20
+        height = self.tree.winfo_height()
+        if height <= 1:
+            height = int(self.tree.cget("height")) * row_height
+        return max(1, height // row_height - 1)  # One row's worth goes to the headings
+
+    def render(self):
+        visible = self.visible_rows()
+        self._start = max(0, self.first - self.buffer_rows)
+        self._end = min(self._rows, self.first + visible + self.buffer_rows)
+
+        self.tree.delete(*self.tree.get_children())
+        for row in range(self._start, self._end):
+            self.tree.insert("", "end", iid=self.key(row), values=self.row_values(row))
+
+        selected = [key for key in self._selected if self.tree.exists(key)]
+        self.tree.selection_set(selected)
+        self._rendered_selection = tuple(selected)
+        self._move_tree_view()
+        self._update_scrollbar()
+
+    def _move_tree_view(self):
+        count = self._end - self._start
+        if count:
+            self.tree.yview_moveto((self.first - self._start) / count)
+
+    def _update_scrollbar(self):
+        if self._rows:
+            visible = self.visible_rows()
+            self.scrollbar.set(self.first / self._rows, min(1.0, (self.first + visible) / self._rows))
         else:
-            self.sales_data = pd.DataFrame(columns=["Item ID", "Item Name", "Quantity", "Date", "Time"])
-
-    def save_sales(self):
-        self.sales_data.to_csv(SALES_FILE, index=False)
-
-    def record_sale(self, item_id, item_name, quantity):
-        now = datetime.now()
-        sale_date = now.strftime("%Y-%m-%d")
-        sale_time = now.strftime("%H:%M:%S")
-        
-        # Create new sale DataFrame with explicit column names
-        new_sale = pd.DataFrame({
-            "Item ID": [item_id],
-            "Item Name": [item_name],
-            "Quantity": [quantity],
-            "Date": [sale_date],
-            "Time": [sale_time]
-        })
-        
-        # Ensure columns match before concatenation
-        self.sales_data = pd.concat([self.sales_data, new_sale], ignore_index=True)
-        self.save_sales()
-
-class UserManager:
-    def __init__(self):
-        self.users = pd.DataFrame(columns=["Username", "Password", "Role"])
-        self.initialize_default_users()
-
-    def initialize_default_users(self):
-        for username, password in DEFAULT_USERS.items():
-            self.add_user(username, password, "admin" if username == "admin" else "staff")
-
-    def add_user(self, username, password, role):
-        new_user = pd.DataFrame([[username, password, role]], columns=self.users.columns)
-        self.users = pd.concat([self.users, new_user], ignore_index=True)
-
-    def authenticate(self, username, password):
-        user = self.users[(self.users['Username'] == username) & (self.users['Password'] == password)]
-        if not user.empty:
-            return user['Role'].values[0]
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_to(self, first):
+        visible = self.visible_rows()
+        self.first = max(0, min(first, self._rows - visible))
+        if self._start <= self.first and self.first + visible <= self._end:
+            self._move_tree_view()
+            self._update_scrollbar()
         else:
-            return None
+            self.render()
+
+    def yview(self, *args):
+        # Scrollbar command: ("moveto", fraction) or ("scroll", amount, "units"/"pages")
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * self._rows))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self.visible_rows()
+            self.scroll_to(self.first + step)
+
+    def _on_tree_scroll(self, first, last):
+        # The tree scrolled itself (mouse wheel, arrow keys): follow it, and slide the
+        # materialized window once the view gets close to either end of the buffer
+        count = self._end - self._start
+        if not count:
+            self._update_scrollbar()
+            return
+        self.first = self._start + int(round(float(first) * count))
+        margin = self.buffer_rows // 2
+        if (self._start > 0 and self.first - self._start < margin) or \
+                (self._end < self._rows and self._end - (self.first + self.visible_rows()) < margin):
+            self.render()
+        else:
+            self._update_scrollbar()
+
+    def _on_select(self, event):
+        selection = tuple(self.tree.selection())
+        if selection == self._rendered_selection:
+            return  # Caused by re-rendering, not by the user
+        self._selected = selection
+        self._rendered_selection = selection
+        if self.on_select:
+            self.on_select(event)
+
+
+class ExpiryMonitor:
+    # Re-runs the expiry queries on a Tk timer, so checking never blocks the UI, and hands
+    # the results to on_alert whenever an item that wasn't flagged before shows up
+    def __init__(self, root, inventory, on_alert, days=EXPIRY_WARNING_DAYS, interval_ms=EXPIRY_CHECK_INTERVAL_MS):
+        self.root = root
+        self.inventory = inventory
+        self.on_alert = on_alert
+        self.days = days
+        self.interval_ms = interval_ms
+        self._alerted = set()
+        self._job = None
+
+    def start(self, delay_ms=0):
+        self.stop()
+        self._job = self.root.after(delay_ms, self._run)
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _run(self):
+        self._job = self.root.after(self.interval_ms, self._run)
+        self.check()
+
+    def check(self, force=False):
+        expired = self.inventory.expiry_index.expired()
+        expiring = self.inventory.expiry_index.expiring_within(self.days)
+        flagged = {item_id for _, item_id in expired} | {item_id for _, item_id in expiring}
+        if flagged and (force or flagged - self._alerted):
+            self.on_alert(expired, expiring)
+        self._alerted = flagged
 
 
 class PharmacyApp:
-    def __init__(self, root, role):
+    def __init__(self, root, role, models=None):
         self.root = root
         self.role = role
-        self.inventory = Inventory()
-        self.sales = Sales()
+        # models: what load_models() returned, if it was run ahead of time
+        self.storage, self.inventory, self.sales, self.analytics, self.forecast = models or load_models()
         self.user_manager = UserManager()
 
-        self.create_widgets()
-        self.check_expirations()  # This will now work correctly
+        self.search_term = None
 
-    def check_expirations(self):
+        self.create_widgets()
+        # Lists are patched from the models' change events rather than rebuilt
+        self.inventory.subscribe(self.on_inventory_changed)
+        self.sales.subscribe(self.on_sales_changed)
+        # Expiry alerts come from a periodic check instead of a dialog at login
+        self.alert_window = None
+        self.expiry_monitor = ExpiryMonitor(self.root, self.inventory, self.show_expiry_alerts)
+        self.expiry_monitor.start()
+
+        # Pending background writes are flushed before the window goes away
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.service_error = None
+        self.service_job = None
+        self.file_job = None
+        if USE_SERVICE:
+            self.service_job = self.root.after(SERVICE_POLL_MS, self.poll_service)
+        elif SHARED_FILES:
+            self.file_job = self.root.after(FILE_POLL_MS, self.poll_files)
+        self.update_save_status()
+
+    @timed
+    def poll_files(self):
+        # Picks up what other instances wrote to the shared files; unchanged files cost a stat
+        self.inventory.refresh()
+        if self.sales.refresh():
+            self.update_sales_history()
+            self.analytics.build()
+            self.forecast.build()
+            self.update_reports()
+        self.file_job = self.root.after(FILE_POLL_MS, self.poll_files)
+
+    @timed
+    def poll_service(self):
+        # Picks up the changes made on other terminals
         try:
-            expiring_items = self.inventory.check_expirations()
-            if not expiring_items.empty:
-                message = "The following items are expiring within 30 days:\n\n"
-                for _, item in expiring_items.iterrows():
-                    expiry_date = item['Expiration Date'].strftime('%Y-%m-%d')
-                    message += f"{item['Name']}: {expiry_date}\n"
-                messagebox.showwarning("Expiring Items", message)
-        except Exception as e:
-            print(f"Error checking expirations: {e}")
+            if self.storage.sync():
+                # The service was restarted and everything was reloaded
+                self.update_inventory_list(self.search_term)
+                self.update_sales_history()
+                self.analytics.build()
+                self.forecast.build()
+                self.update_reports()
+            self.service_error = None
+        except OSError as e:
+            self.service_error = e
+        self.service_job = self.root.after(SERVICE_POLL_MS, self.poll_service)
+
+    def update_save_status(self):
+        writer = getattr(self.storage, "writer", None)
+        if self.service_error is not None:
+            text = f"Service unavailable: {self.service_error}"
+        elif writer is not None and writer.error is not None:
+            text = f"Save failed: {writer.error}"
+        elif writer is not None and writer.pending():
+            text = f"Unsaved changes ({writer.pending()} pending)"
+        else:
+            text = "All changes saved"
+        self.status_label.configure(text=text)
+        self.status_job = self.root.after(SAVE_STATUS_INTERVAL_MS, self.update_save_status)
+
+    def on_close(self):
+        self.expiry_monitor.stop()
+        self.root.after_cancel(self.status_job)
+        if self.service_job is not None:
+            self.root.after_cancel(self.service_job)
+        if self.file_job is not None:
+            self.root.after_cancel(self.file_job)
+        # Refreshes still waiting would otherwise run against destroyed widgets
+        for job in (self.search_job, self.reports_job, self.reorder_job):
+            if job is not None:
+                self.root.after_cancel(job)
+        self.search_job = self.reports_job = self.reorder_job = None
+        self.status_label.configure(text="Saving...")
+        self.root.update_idletasks()
+        self.sales.checkpoint()
+        self.storage.close()
+        self.root.destroy()
+
+    @timed
+    def check_expirations(self):
+        # Check right away and show the alerts even if nothing new has come up
+        self.expiry_monitor.check(force=True)
+
+    def show_expiry_alerts(self, expired, expiring):
+        self.alerts = [(item_id, date, "Expired") for date, item_id in expired]
+        self.alerts += [(item_id, date, "Expiring soon") for date, item_id in expiring]
+        self.alert_summary = f"{len(expired)} expired, {len(expiring)} expiring within {self.expiry_monitor.days} days"
+
+        if self.alert_window is None or not self.alert_window.winfo_exists():
+            self.alert_window = tk.Toplevel(self.root)
+            self.alert_window.title("Expiry Alerts")
+            self.alert_window.transient(self.root)
+
+            self.alert_label = ttk.Label(self.alert_window, padding="10 10 10 0")
+            self.alert_label.pack(fill=tk.X)
+
+            self.alert_tree = ttk.Treeview(self.alert_window, columns=("ID", "Name", "Quantity", "Expiration Date", "Status"), show="headings", height=EXPIRY_ALERT_PAGE_SIZE)
+            for col in ("ID", "Name", "Quantity", "Expiration Date", "Status"):
+                self.alert_tree.heading(col, text=col)
+                self.alert_tree.column(col, width=120)
+            self.alert_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+            pager = ttk.Frame(self.alert_window, padding="10 0 10 10")
+            pager.pack(fill=tk.X)
+            ttk.Button(pager, text="Previous", command=lambda: self.show_alert_page(self.alert_page - 1)).pack(side=tk.LEFT)
+            self.alert_page_label = ttk.Label(pager)
+            self.alert_page_label.pack(side=tk.LEFT, expand=True)
+            ttk.Button(pager, text="Next", command=lambda: self.show_alert_page(self.alert_page + 1)).pack(side=tk.RIGHT)
+
+        self.show_alert_page(0)
+
+    def show_alert_page(self, page):
+        pages = max(1, -(-len(self.alerts) // EXPIRY_ALERT_PAGE_SIZE))
+        self.alert_page = max(0, min(page, pages - 1))
+        start = self.alert_page * EXPIRY_ALERT_PAGE_SIZE
+
+        self.alert_label.configure(text=self.alert_summary)
+        self.alert_page_label.configure(text=f"Page {self.alert_page + 1} of {pages}")
+        self.alert_tree.delete(*self.alert_tree.get_children())
+        for item_id, date, status in self.alerts[start:start + EXPIRY_ALERT_PAGE_SIZE]:
+            item = self.inventory.get_item(item_id)
+            name = item['Name'] if item is not None else ""
+            # Just the lot expiring on that date, not the item's whole stock
+            quantity = self.inventory.lots.lot_quantity(item_id, date)
+            self.alert_tree.insert("", "end", values=(item_id, name, quantity, date, status))
 
     def create_widgets(self):
         style = ttk.Style()
@@ -175,6 +405,14 @@ class PharmacyApp:
         style.configure("Treeview", rowheight=25, font=('TkDefaultFont', 9))
         style.configure("Treeview.Heading", font=('TkDefaultFont', 10, 'bold'))
 
+        # Save status, along the bottom of the window
+        self.status_label = ttk.Label(self.root, padding="10 0 10 5")
+        self.status_label.pack(side=tk.BOTTOM, fill=tk.X)
+
+        # Timing stats and profiling, for admins only
+        if self.role == "admin":
+            self.create_admin_menu()
+
         # Create a notebook (tab) widget
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(expand=True, fill='both', padx=10, pady=10)
@@ -182,10 +420,12 @@ class PharmacyApp:
         # Create tabs
         self.inventory_tab = ttk.Frame(self.notebook)
         self.sales_tab = ttk.Frame(self.notebook)
+        self.reports_tab = ttk.Frame(self.notebook)
 
         # Add tabs to notebook
         self.notebook.add(self.inventory_tab, text='Inventory')
         self.notebook.add(self.sales_tab, text='Sales')
+        self.notebook.add(self.reports_tab, text='Reports')
 
         # Create inventory tab widgets
         self.create_inventory_widgets()
@@ -193,6 +433,44 @@ class PharmacyApp:
         # Create sales tab widgets
         self.create_sales_widgets()
 
+        # Create reports tab widgets
+        self.create_reports_widgets()
+
+    def create_admin_menu(self):
+        self.profiler = Profiler()
+        menubar = tk.Menu(self.root)
+        self.admin_menu = tk.Menu(menubar, tearoff=0)
+        self.admin_menu.add_command(label="Show Timing Stats", command=self.show_timing_stats)
+        self.admin_menu.add_command(label="Dump Timing Stats", command=self.dump_timing_stats)
+        self.admin_menu.add_command(label="Reset Timing Stats", command=timings.reset)
+        self.admin_menu.add_separator()
+        self.admin_menu.add_command(label="Start Profiling", command=self.toggle_profiling)
+        self.profile_menu_index = self.admin_menu.index("end")
+        menubar.add_cascade(label="Admin", menu=self.admin_menu)
+        self.root.configure(menu=menubar)
+
+    def show_report(self, title, text):
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        report = tk.Text(window, wrap=tk.NONE, width=100, height=30, font=("TkFixedFont", 9))
+        report.insert("1.0", text)
+        report.configure(state=tk.DISABLED)
+        report.pack(fill=tk.BOTH, expand=True)
+
+    def show_timing_stats(self):
+        self.show_report("Timing Stats", timings.report())
+
+    def dump_timing_stats(self):
+        timings.dump(TIMING_DUMP_FILE)
+        messagebox.showinfo("Timing Stats", f"Timing stats written to {TIMING_DUMP_FILE}")
+
+    def toggle_profiling(self):
+        if not self.profiler.running:
+            self.profiler.start()
+            self.admin_menu.entryconfigure(self.profile_menu_index, label="Stop Profiling")
+            return
+        self.admin_menu.entryconfigure(self.profile_menu_index, label="Start Profiling")
+        self.show_report(f"Profile (saved to {PROFILE_FILE})", self.profiler.stop(PROFILE_FILE))
 
     def create_inventory_widgets(self):
         # Create a frame to hold both sections side by side
@@ -222,6 +500,9 @@ class PharmacyApp:
         self.add_button = ttk.Button(self.add_item_frame, text="Add Item", command=self.add_item)
         self.add_button.grid(row=4, columnspan=2, pady=5)
 
+        self.import_button = ttk.Button(self.add_item_frame, text="Import Delivery...", command=self.import_delivery)
+        self.import_button.grid(row=5, columnspan=2, pady=5)
+
         # Frame for searching, editing, and deleting items
         self.search_edit_frame = ttk.LabelFrame(self.inventory_frame, text="Search and Edit", padding="10 10 10 10")
         self.search_edit_frame.grid(row=0, column=1, padx=10, pady=10, sticky=tk.NSEW)  # Place it in the second column
@@ -232,6 +513,9 @@ class PharmacyApp:
         self.search_entry.grid(row=0, column=1)
         self.search_button = ttk.Button(self.search_edit_frame, text="Search", command=self.search_inventory)
         self.search_button.grid(row=0, column=2)
+        # Search as you type, once typing pauses
+        self.search_job = None
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
 
         # Edit and Delete section
         tk.Label(self.search_edit_frame, text="Quantity").grid(row=1, column=0)
@@ -248,6 +532,9 @@ class PharmacyApp:
         self.delete_button = ttk.Button(self.search_edit_frame, text="Delete Item", command=self.delete_item)
         self.delete_button.grid(row=3, column=1)
 
+        self.expiry_button = ttk.Button(self.search_edit_frame, text="Expiry Alerts", command=self.check_expirations)
+        self.expiry_button.grid(row=3, column=2)
+
         # Frame for inventory list
         self.inventory_list_frame = ttk.Frame(self.inventory_tab, padding="10 10 10 10")
         self.inventory_list_frame.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)  # Use expand=True
@@ -255,10 +542,11 @@ class PharmacyApp:
         self.inventory_tree = ttk.Treeview(self.inventory_list_frame, columns=["ID", "Name", "Quantity", "Expiration Date"], show="headings")
         self.inventory_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)  # Use expand=True
 
-        self.inventory_scrollbar = tk.Scrollbar(self.inventory_list_frame, orient=tk.VERTICAL, command=self.inventory_tree.yview)
+        self.inventory_scrollbar = tk.Scrollbar(self.inventory_list_frame, orient=tk.VERTICAL)
         self.inventory_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
-        self.inventory_tree.configure(yscrollcommand=self.inventory_scrollbar.set)
+        # Only the rows in view are put into the tree
+        self.inventory_view = VirtualTreeview(self.inventory_tree, self.inventory_scrollbar, INVENTORY_COLUMNS, on_select=self.on_select)
 
         self.inventory_tree.heading("ID", text="ID")
         self.inventory_tree.heading("Name", text="Name")
@@ -273,8 +561,6 @@ class PharmacyApp:
 
         self.update_inventory_list()
 
-        self.inventory_tree.bind("<<TreeviewSelect>>", self.on_select)
-
     def create_sales_widgets(self):
         # Frame for recording sales
         self.sales_frame = ttk.LabelFrame(self.sales_tab, text="Record Sale", padding="10 10 10 10")
@@ -289,7 +575,42 @@ class PharmacyApp:
         self.sales_quantity.grid(row=1, column=1, sticky=tk.W, pady=2)
 
         self.record_sale_button = ttk.Button(self.sales_frame, text="Record Sale", command=self.record_sale)
-        self.record_sale_button.grid(row=2, column=0, columnspan=2, pady=10)
+        self.record_sale_button.grid(row=2, column=0, pady=10)
+
+        self.add_to_cart_button = ttk.Button(self.sales_frame, text="Add to Cart", command=self.add_to_cart)
+        self.add_to_cart_button.grid(row=2, column=1, pady=10)
+
+        # Cart for multi-line sales, checked out in one go
+        self.cart = []
+        self.cart_tree = ttk.Treeview(self.sales_frame, columns=("Item ID", "Item Name", "Quantity"), show="headings", height=4)
+        for col in ("Item ID", "Item Name", "Quantity"):
+            self.cart_tree.heading(col, text=col)
+            self.cart_tree.column(col, width=100)
+        self.cart_tree.grid(row=0, column=2, rowspan=3, padx=10, sticky=tk.NSEW)
+
+        self.remove_from_cart_button = ttk.Button(self.sales_frame, text="Remove Line", command=self.remove_from_cart)
+        self.remove_from_cart_button.grid(row=0, column=3, sticky=tk.EW)
+        self.checkout_button = ttk.Button(self.sales_frame, text="Checkout", command=self.checkout)
+        self.checkout_button.grid(row=1, column=3, sticky=tk.EW)
+
+        # Date filter for the sales history; older months are only loaded when asked for
+        self.sales_range = None
+        self.sales_filter_frame = ttk.Frame(self.sales_tab, padding="10 0 10 0")
+        self.sales_filter_frame.pack(padx=10, fill=tk.X)
+
+        ttk.Label(self.sales_filter_frame, text="From").pack(side=tk.LEFT)
+        self.sales_from = ttk.Entry(self.sales_filter_frame, width=12)
+        self.sales_from.pack(side=tk.LEFT, padx=5)
+        ttk.Label(self.sales_filter_frame, text="To").pack(side=tk.LEFT)
+        self.sales_to = ttk.Entry(self.sales_filter_frame, width=12)
+        self.sales_to.pack(side=tk.LEFT, padx=5)
+
+        ttk.Button(self.sales_filter_frame, text="Filter", command=self.filter_sales).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.sales_filter_frame, text="Clear", command=self.clear_sales_filter).pack(side=tk.LEFT)
+        self.load_older_button = ttk.Button(self.sales_filter_frame, text="Load Older Month", command=self.load_older_sales)
+        self.load_older_button.pack(side=tk.LEFT, padx=5)
+        self.sales_count_label = ttk.Label(self.sales_filter_frame)
+        self.sales_count_label.pack(side=tk.RIGHT)
 
         # Frame for sales history
         self.sales_history_frame = ttk.Frame(self.sales_tab, padding="10 10 10 10")
@@ -304,9 +625,11 @@ class PharmacyApp:
         self.sales_history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
         # Add a scrollbar
-        scrollbar = ttk.Scrollbar(self.sales_history_frame, orient=tk.VERTICAL, command=self.sales_history_tree.yview)
+        scrollbar = ttk.Scrollbar(self.sales_history_frame, orient=tk.VERTICAL)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.sales_history_tree.configure(yscrollcommand=scrollbar.set)
+        self.sales_history_view = VirtualTreeview(
+            self.sales_history_tree, scrollbar,
+            ["Item ID", "Item Name", "Quantity", ("Timestamp", DATE_FORMAT), ("Timestamp", TIME_FORMAT)])
 
         # Configure the columns
         for col in ("Item ID", "Item Name", "Quantity", "Date", "Time"):
@@ -316,6 +639,83 @@ class PharmacyApp:
         # Update the sales history display
         self.update_sales_history()
 
+    def create_reports_widgets(self):
+        controls = ttk.Frame(self.reports_tab, padding="10 10 10 0")
+        controls.pack(fill=tk.X)
+        ttk.Label(controls, text="Last days").pack(side=tk.LEFT)
+        self.report_days = ttk.Combobox(controls, values=REPORT_WINDOWS, width=6, state="readonly")
+        self.report_days.set("30")
+        self.report_days.pack(side=tk.LEFT, padx=5)
+        self.report_days.bind("<<ComboboxSelected>>", lambda event: self.update_reports())
+
+        tables = ttk.Frame(self.reports_tab, padding="10 10 10 10")
+        tables.pack(fill=tk.BOTH, expand=True)
+
+        self.daily_totals_tree = ttk.Treeview(tables, columns=("Date", "Units Sold"), show="headings")
+        for col in ("Date", "Units Sold"):
+            self.daily_totals_tree.heading(col, text=col)
+            self.daily_totals_tree.column(col, width=100)
+        self.daily_totals_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
+
+        self.top_sellers_tree = ttk.Treeview(tables, columns=("Item ID", "Item Name", "Units Sold", "Units/Day"), show="headings")
+        for col in ("Item ID", "Item Name", "Units Sold", "Units/Day"):
+            self.top_sellers_tree.heading(col, text=col)
+            self.top_sellers_tree.column(col, width=100)
+        self.top_sellers_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # Low stock: items that will run out within the reorder lead time at their current demand
+        reorder = ttk.Frame(self.reports_tab, padding="10 0 10 10")
+        reorder.pack(fill=tk.BOTH, expand=True)
+        self.reorder_label = ttk.Label(reorder)
+        self.reorder_label.pack(fill=tk.X, pady=(0, 5))
+        reorder_columns = ("Item ID", "Item Name", "Quantity", "Units/Day", "Days Left", "Stock-Out Date", "Order Quantity")
+        self.reorder_tree = ttk.Treeview(reorder, columns=reorder_columns, show="headings")
+        for col in reorder_columns:
+            self.reorder_tree.heading(col, text=col)
+            self.reorder_tree.column(col, width=100)
+        self.reorder_tree.pack(fill=tk.BOTH, expand=True)
+        self.reorder_job = None
+        self.reports_job = None
+
+        self.update_reports()
+
+    def schedule_reports_update(self):
+        # Every sale event changes the reports; events handled together share one refresh
+        if self.reports_job is None:
+            self.reports_job = self.root.after_idle(self.update_reports)
+
+    @timed
+    def update_reports(self):
+        self.reports_job = None
+        days = int(self.report_days.get())
+        today = datetime.now().date()
+        start = (today - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+        self.daily_totals_tree.delete(*self.daily_totals_tree.get_children())
+        for date, units in reversed(self.analytics.daily_totals(start)):
+            self.daily_totals_tree.insert("", "end", values=(date, units))
+
+        self.top_sellers_tree.delete(*self.top_sellers_tree.get_children())
+        for item_id, name, units in self.analytics.top_sellers(REPORT_TOP_SELLERS, start):
+            velocity = self.analytics.velocity(item_id, days, today)
+            self.top_sellers_tree.insert("", "end", values=(item_id, name, units, f"{velocity:.2f}"))
+        self.schedule_reorder_update()
+
+    def schedule_reorder_update(self):
+        # A sale changes both stock and sales; their events share one refresh
+        if self.reorder_job is None:
+            self.reorder_job = self.root.after_idle(self.update_reorder_list)
+
+    @timed
+    def update_reorder_list(self):
+        self.reorder_job = None
+        suggestions = self.forecast.reorder_suggestions()
+        self.reorder_label.configure(text=f"{len(suggestions)} items at or below their reorder point")
+        self.reorder_tree.delete(*self.reorder_tree.get_children())
+        for row in suggestions.head(REPORT_REORDER_ROWS).itertuples(index=False):
+            self.reorder_tree.insert("", "end", values=(row[0], row[1], row[2], f"{row[3]:.2f}", f"{row[4]:.1f}",
+                                                        row[5], row[7]))
+
     def add_item(self):
         item_id = self.item_id.get().strip()
         name = self.item_name.get().strip()
@@ -344,11 +744,17 @@ class PharmacyApp:
             messagebox.showerror("Error", "Invalid expiration date format. Use YYYY-MM-DD.")
             return
 
-        # If all checks pass, add the item
-        success, message = self.inventory.add_item(item_id, name, quantity, expiration_date)
+        # A known ID is a restock, kept as a new lot
+        if self.inventory.has_item(item_id):
+            if not messagebox.askyesno("Receive Stock", f"Item ID '{item_id}' already exists. Receive {quantity} "
+                                                        f"more as a lot expiring {expiration_date}?"):
+                return
+            success, message = self.inventory.receive_lot(item_id, quantity, expiration_date)
+        else:
+            # If all checks pass, add the item
+            success, message = self.inventory.add_item(item_id, name, quantity, expiration_date)
         if success:
             messagebox.showinfo("Success", message)
-            self.update_inventory_list()
 
             # Clear the input fields
             self.item_id.delete(0, tk.END)
@@ -358,74 +764,166 @@ class PharmacyApp:
         else:
             messagebox.showerror("Error", message)
 
+    def import_delivery(self):
+        path = filedialog.askopenfilename(title="Import Delivery",
+                                          filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        success, message, rejections = self.inventory.import_delivery(path)
+        if not success:
+            messagebox.showerror("Error", message)
+            return
+        if rejections.empty:
+            messagebox.showinfo("Success", message)
+            return
+        if messagebox.askyesno("Import Delivery", f"{message}\n\nSave a report of the rejected rows?"):
+            report = filedialog.asksaveasfilename(title="Save Rejected Rows", defaultextension=".csv",
+                                                  initialfile="rejected_rows.csv")
+            if report:
+                rejections.to_csv(report, index=False)
+
+    @timed
     def update_inventory_list(self, search_term=None):
-        self.inventory_tree.delete(*self.inventory_tree.get_children())
+        self.search_term = search_term
         if search_term:
-            inventory_data = self.inventory.search_inventory(search_term)
+            inventory_data = self.inventory.search_inventory(search_term, SEARCH_RESULT_LIMIT)
         else:
             inventory_data = self.inventory.get_inventory()
-        for index, row in inventory_data.iterrows():
-            self.inventory_tree.insert("", "end", values=list(row))
+        self.inventory_view.set_data(inventory_data, keys=inventory_data['ID'])
 
+    @timed
     def update_sales_history(self):
-        # Clear the existing items in the tree
-        for item in self.sales_history_tree.get_children():
-            self.sales_history_tree.delete(item)
-
-        # Get the sales data
         sales_data = self.sales.sales_data
+        if self.sales_range is not None:
+            start, end = self.sales_range
+            timestamps = sales_data['Timestamp']
+            mask = pd.Series(True, index=sales_data.index)
+            if start:
+                mask &= timestamps >= pd.Timestamp(start)
+            if end:
+                mask &= timestamps < pd.Timestamp(end) + pd.Timedelta(days=1)
+            sales_data = sales_data[mask]
+        self.sales_history_view.set_data(sales_data)
+        self.update_sales_count(len(sales_data))
+
+    def update_sales_count(self, shown):
+        loaded = self.sales.loaded_months
+        if loaded:
+            months = sorted(loaded)
+            span = months[0] if len(months) == 1 else f"{months[0]} to {months[-1]}"
+            self.sales_count_label.configure(text=f"{shown} sales shown ({span} loaded)")
+        else:
+            self.sales_count_label.configure(text=f"{shown} sales shown")
+
+    def filter_sales(self):
+        start = self.sales_from.get().strip()
+        end = self.sales_to.get().strip()
+        try:
+            for date in (start, end):
+                if date:
+                    datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            messagebox.showerror("Error", "Invalid date format. Use YYYY-MM-DD.")
+            return
+        if start and end and start > end:
+            messagebox.showerror("Error", "The start date must not be after the end date.")
+            return
+        # Only the months in the range are kept in memory
+        self.sales.load_range(start, end)
+        self.sales_range = (start, end) if start or end else None
+        self.update_sales_history()
+
+    def clear_sales_filter(self):
+        self.sales_from.delete(0, tk.END)
+        self.sales_to.delete(0, tk.END)
+        self.sales_range = None
+        self.sales.load_months(())
+        self.update_sales_history()
+
+    def load_older_sales(self):
+        month = self.sales.load_older_month()
+        if month is None:
+            messagebox.showinfo("Sales History", "There are no older sales.")
+            return
+        # Show everything loaded, including the month just paged in
+        self.sales_from.delete(0, tk.END)
+        self.sales_to.delete(0, tk.END)
+        self.sales_range = None
+        self.update_sales_history()
+
+    @timed
+    def on_inventory_changed(self, event):
+        if self.search_term:
+            # Search results are a filtered slice, so simply re-run the search
+            self.update_inventory_list(self.search_term)
+        else:
+            inventory_data = self.inventory.get_inventory()
+            self.inventory_view.apply_changes(inventory_data, event, keys=inventory_data['ID'])
+        self.schedule_reorder_update()
+
+    @timed
+    def on_sales_changed(self, event):
+        if self.sales_range is not None:
+            # The filtered list is a slice of the history, so filter it again
+            self.update_sales_history()
+        else:
+            self.sales_history_view.apply_changes(self.sales.sales_data, event)
+            self.update_sales_count(len(self.sales.sales_data))
+        self.schedule_reports_update()
 
-        # Populate the tree with sales data
-        for _, row in sales_data.iterrows():
-            self.sales_history_tree.insert("", "end", values=(
-                row["Item ID"],
-                row["Item Name"],
-                row["Quantity"],
-                row["Date"],
-                row["Time"]
-            ))
     def on_select(self, event):
-        selected_item = self.inventory_tree.selection()  # Get the selected item
+        selected_item = self.inventory_view.selection()  # Item IDs of the selected rows
         if selected_item:  # Check if an item is selected
-            item = self.inventory_tree.item(selected_item[0])  # Get the item details
-            if item and 'values' in item:
+            item = self.inventory.get_item(selected_item[0])  # Get the item details
+            if item is not None:
                 self.edit_quantity.delete(0, tk.END)
-                self.edit_quantity.insert(0, item['values'][2])  # Quantity
+                self.edit_quantity.insert(0, item['Quantity'])
                 self.edit_expiration.delete(0, tk.END)
-                self.edit_expiration.insert(0, item['values'][3])  # Expiration Date
+                self.edit_expiration.insert(0, ExpiryIndex.format_date(item['Expiration Date']) or "")
 
+    @timed
     def search_inventory(self):
+        self.search_job = None
         search_term = self.search_entry.get()
         self.update_inventory_list(search_term)
 
+    def schedule_search(self, event):
+        # Debounce: restart the timer on every keystroke
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DEBOUNCE_MS, self.search_inventory)
+
     def edit_item(self):
-        selected_item = self.inventory_tree.selection()  # Get the selected item
+        selected_item = self.inventory_view.selection()  # Get the selected item
         if selected_item:  # Check if an item is selected
-            item_id = self.inventory_tree.item(selected_item[0])['values'][0]
-            quantity = self.edit_quantity.get()
-            expiration_date = self.edit_expiration.get()
-            self.inventory.edit_item(item_id, quantity, expiration_date)
+            item_id = selected_item[0]  # Rows are keyed by item ID
+            quantity = self.edit_quantity.get().strip() or None
+            expiration_date = self.edit_expiration.get().strip() or None
+            success, message = self.inventory.edit_item(item_id, quantity, expiration_date)
+            if not success:
+                messagebox.showerror("Error", message)
+                return
             messagebox.showinfo("Success", "Item edited successfully!")
-            self.update_inventory_list()
 
     def delete_item(self):
-        selected_item = self.inventory_tree.selection()  # Get the selected item
+        selected_item = self.inventory_view.selection()  # Get the selected item
         if selected_item:  # Check if an item is selected
-            item_id = self.inventory_tree.item(selected_item[0])['values'][0]
-            self.inventory.delete_item(item_id)
+            item_id = selected_item[0]  # Rows are keyed by item ID
+            success, message = self.inventory.delete_item(item_id)
+            if not success:
+                messagebox.showerror("Error", message)
+                return
             messagebox.showinfo("Success", "Item deleted successfully!")
-            self.update_inventory_list()
 
-    def record_sale(self):
+    def read_sale_line(self):
+        # Returns (item ID, quantity) from the sale entries, or None after showing an error
         item_id = self.sales_item_id.get().strip()
         quantity = self.sales_quantity.get().strip()
 
-        print(f"Attempting to record sale: Item ID: {item_id}, Quantity: {quantity}")
-
         # Validate inputs
         if not item_id or not quantity:
             messagebox.showerror("Error", "All fields must be filled!")
-            return
+            return None
 
         try:
             quantity = int(quantity)
@@ -433,77 +931,64 @@ class PharmacyApp:
                 raise ValueError
         except ValueError:
             messagebox.showerror("Error", "Quantity must be a positive integer!")
-            return
+            return None
 
         # Check if item exists in inventory
-        inventory_data = self.inventory.get_inventory()
-
-        # Convert item_id to string and strip whitespace from inventory IDs
-        item_id = str(item_id).strip()
-        inventory_data['ID'] = inventory_data['ID'].astype(str).str.strip()
+        if not self.inventory.has_item(item_id):
+            messagebox.showerror("Error", f"Item ID '{item_id}' not found in inventory!")
+            return None
+        return item_id, quantity
 
-        item = inventory_data[inventory_data['ID'] == item_id]
+    def clear_sale_entries(self):
+        self.sales_item_id.delete(0, tk.END)
+        self.sales_quantity.delete(0, tk.END)
 
-        if item.empty:
-            messagebox.showerror("Error", f"Item ID '{item_id}' not found in inventory!")
+    def record_sale(self):
+        line = self.read_sale_line()
+        if line is None:
             return
 
-        current_quantity = int(item['Quantity'].iloc[0])
-        if quantity > current_quantity:
-            messagebox.showerror("Error", "Not enough stock available!")
+        log.debug("Recording sale with: Item ID: %s, Quantity: %s", line[0], line[1])
+        success, message = self.sales.record_sales_batch(self.inventory, [line])
+        if not success:
+            messagebox.showerror("Error", message)
             return
 
-        # Update inventory quantity
-        new_quantity = current_quantity - quantity
-        self.inventory.edit_item(item_id, new_quantity)
+        messagebox.showinfo("Success", message)
+        self.clear_sale_entries()
 
-        # Record the sale
-        item_name = item['Name'].iloc[0]
-        print(f"Recording sale with: Item ID: {item_id}, Item Name: {item_name}, Quantity: {quantity}")
-        self.sales.record_sale(item_id, item_name, quantity)
-
-        messagebox.showinfo("Success", "Sale recorded successfully!")
-
-        # Clear input fields
-        self.sales_item_id.delete(0, tk.END)
-        self.sales_quantity.delete(0, tk.END)
+    def add_to_cart(self):
+        line = self.read_sale_line()
+        if line is None:
+            return
+        item_id, quantity = line
+        self.cart.append(line)
+        self.cart_tree.insert("", "end", values=(item_id, self.inventory.get_item(item_id)['Name'], quantity))
+        self.clear_sale_entries()
+
+    def remove_from_cart(self):
+        selected = self.cart_tree.selection()
+        if selected:
+            index = self.cart_tree.index(selected[0])
+            del self.cart[index]
+            self.cart_tree.delete(selected[0])
+
+    def checkout(self):
+        success, message = self.sales.record_sales_batch(self.inventory, self.cart)
+        if not success:
+            messagebox.showerror("Error", message)
+            return
 
-        # Update both inventory and sales displays
-        self.update_inventory_list()
-        self.update_sales_history()  # Make sure this line is here
+        messagebox.showinfo("Success", message)
+        self.cart = []
+        self.cart_tree.delete(*self.cart_tree.get_children())
 
 def main():
     root = ThemedTk(theme="arc")  # Use a modern theme
-    root.title("Pharmacy Management System")
-
-    # Set minimum and maximum window sizes
-    root.minsize(800, 600)
-    root.maxsize(1200, 800)
-
-    # Set custom fonts
-    default_font = tkfont.nametofont("TkDefaultFont")
-    default_font.configure(size=10)
-    root.option_add("*Font", default_font)
+    configure_root(root)
+    user_manager = UserManager()
 
-    # Set color scheme
-    root.configure(background='#f0f0f0')
-
-    # Create a frame for login
-    login_frame = ttk.Frame(root, padding="20 20 20 20")
-    login_frame.pack(fill=tk.BOTH, expand=True)
-
-    ttk.Label(login_frame, text="Username").grid(row=0, column=0, sticky=tk.W, pady=5)
-    username_entry = ttk.Entry(login_frame)
-    username_entry.grid(row=0, column=1, sticky=tk.E, pady=5)
-
-    ttk.Label(login_frame, text="Password").grid(row=1, column=0, sticky=tk.W, pady=5)
-    password_entry = ttk.Entry(login_frame, show="*")
-    password_entry.grid(row=1, column=1, sticky=tk.E, pady=5)
-
-    def login():
-        username = username_entry.get()
-        password = password_entry.get()
-        user_manager = UserManager()
+    def login(login_frame, username, password):
         role = user_manager.authenticate(username, password)
         if role:
             # Hide the login frame and show the main application
@@ -512,12 +997,8 @@ def main():
         else:
             messagebox.showerror("Invalid Credentials", "Invalid username or password.")
 
-    login_button = ttk.Button(login_frame, text="Login", command=login)
-    login_button.grid(row=2, column=0, columnspan=2, pady=10)
-
-    # Create custom styles
-    style = ttk.Style()
-    style.configure("Accent.TButton", foreground="white", background="#007bff")
+    create_login(root, login)
+    configure_styles()
 
     root.mainloop()
 
@@ -0,0 +1,1191 @@
+# The inventory and sales models, where they are stored, and load_models(). Nothing here
+# imports Tk, so service.py and benchmark.py use the models without a display; main.py
+# builds the app on top of them.
+import bisect
+import heapq
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from analytics import SalesAnalytics
+from forecast import StockForecast
+from instrumentation import timed
+from schema import (INVENTORY_COLUMNS, SALES_COLUMNS, format_dates, inventory_frame, inventory_records, months_of,
+                    parse_dates, sales_frame)
+from storage import CsvStorage, PersistenceWorker, SqliteStorage, current_month, import_csv, partition_sales
+
+INVENTORY_FILE = "inventory.csv"
+SALES_FILE = "sales.csv"
+SALES_JOURNAL_FILE = "sales_journal.csv"
+DATABASE_FILE = "pharmacy.db"
+# Stock lots (quantity and expiration date per delivery) of the items whose stock has changed
+LOTS_FILE = "lots.csv"
+# Checkouts append the new stock of the items sold here, and INVENTORY_FILE is rewritten on
+# the background writer; loading replays what the inventory file doesn't hold yet
+STOCK_JOURNAL_FILE = "stock_journal.csv"
+# Columnar sales snapshots for fast start-up (CSV backend with the journal); None disables them.
+# Only used when SALES_PARTITION_DIR is None.
+SNAPSHOT_DIR = "snapshot"
+# Sales history split into one CSV file per month (CSV backend). Only the current month is
+# loaded at start-up; older months are paged in from the Sales tab. An existing SALES_FILE
+# and journal are split up the first time. None keeps the whole history in SALES_FILE.
+# Month files are appended to directly, so with partitions the journal (SALES_JOURNAL_MODE)
+# and the snapshots (SNAPSHOT_DIR) are not used and Sales.compact()/checkpoint() do nothing:
+# start-up reads one month instead.
+SALES_PARTITION_DIR = "sales"
+
+# Where inventory and sales are stored: "csv" (the files above) or "sqlite" (DATABASE_FILE).
+# A new SQLite database is filled from the CSV files the first time it is opened.
+STORAGE_BACKEND = "csv"
+
+# Append-only sales journal: each sale is appended to SALES_JOURNAL_FILE instead of
+# rewriting SALES_FILE. The journal is folded back into SALES_FILE by Sales.compact().
+# Without partitions only (see SALES_PARTITION_DIR).
+SALES_JOURNAL_MODE = True
+# Durability of each journal append: "none" (left to the OS), "flush" (handed to the OS
+# on every sale) or "fsync" (forced to disk on every sale)
+SALES_DURABILITY = "flush"
+# Write-behind: the app saves CSV files on a background thread, with at most
+# WRITE_QUEUE_SIZE writes waiting. Checkouts are still written before they are reported, so a
+# failed one is rolled back.
+WRITE_BEHIND = True
+WRITE_QUEUE_SIZE = 64
+# Several app instances on the same CSV files: writes take an advisory lock and merge into
+# the files (main.py polls them for what the others wrote)
+SHARED_FILES = False
+# Multi-terminal mode: run `python service.py` once, and set USE_SERVICE on every till so
+# they share that process's inventory and sales instead of each writing the files
+USE_SERVICE = False
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+# Delivery files are read and validated this many rows at a time
+IMPORT_CHUNK_ROWS = 50000
+IMPORT_REJECTION_COLUMNS = ["Line", "ID", "Reason"]
+# Minimum number of rows the in-memory sales buffer grows by
+SALES_CHUNK_ROWS = 1024
+# Items expiring within EXPIRY_WARNING_DAYS are flagged by the expiry queries and alerts
+EXPIRY_WARNING_DAYS = 30
+
+
+def create_storage(backend=None, write_behind=False):
+    backend = backend or STORAGE_BACKEND
+    if backend == "csv":
+        if SALES_PARTITION_DIR and not os.path.exists(SALES_PARTITION_DIR):
+            partition_sales(SALES_PARTITION_DIR, SALES_FILE, SALES_JOURNAL_FILE)
+        writer = PersistenceWorker(WRITE_QUEUE_SIZE) if write_behind else None
+        return CsvStorage(INVENTORY_FILE, SALES_FILE, SALES_JOURNAL_FILE, SALES_JOURNAL_MODE, SALES_DURABILITY, writer,
+                          SNAPSHOT_DIR, SALES_PARTITION_DIR, SHARED_FILES, LOTS_FILE, STOCK_JOURNAL_FILE)
+    if backend == "sqlite":
+        if not os.path.exists(DATABASE_FILE):
+            import_csv(DATABASE_FILE, INVENTORY_FILE, SALES_FILE, SALES_JOURNAL_FILE, LOTS_FILE, SALES_PARTITION_DIR,
+                       STOCK_JOURNAL_FILE)
+        return SqliteStorage(DATABASE_FILE)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+# Rows touched by a change, as positions in the model's frame. Removed positions refer to
+# the frame before the change, inserted and updated ones to the frame after it.
+ChangeEvent = namedtuple("ChangeEvent", ["inserted", "updated", "removed"])
+
+
+class ChangeNotifier:
+    def subscribe(self, callback):
+        # callback(ChangeEvent) is called after every change to the model's rows
+        self._listeners.append(callback)
+
+    def notify(self, inserted=(), updated=(), removed=()):
+        event = ChangeEvent(list(inserted), list(updated), list(removed))
+        for callback in self._listeners:
+            callback(event)
+
+
+class SearchIndex:
+    # Case-insensitive search over item IDs and names. Results are ranked: exact ID, ID
+    # prefix, name prefix, word-in-name prefix, then (for terms of three or more
+    # characters) anywhere in the ID or name. The prefix ranks come from sorted token
+    # lists and the substring rank from a trigram index, so a query only looks at as
+    # many items as it returns. Loading only notes the items down: load_models() builds the
+    # index before the window opens (on startup.py's background thread), and an inventory
+    # reloaded later is indexed on its first search.
+    def __init__(self):
+        # item ID -> name of the items loaded so far; None once the index is built
+        self._unindexed = {}
+        self._grams = {}  # trigram -> set of item IDs
+        self._names = {}  # item ID -> lowercased name
+        # Sorted (token, item ID) pairs for IDs, whole names and words in names
+        self._id_tokens = []
+        self._name_tokens = []
+        self._word_tokens = []
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _item_trigrams(self, key, name):
+        # The separator keeps trigrams from spanning the ID and the name
+        return self._trigrams(key + "\0" + name)
+
+    def build(self, item_ids, names):
+        # Bulk load; before the first search the items are only noted down
+        if self._unindexed is not None:
+            self._unindexed.update(zip(item_ids, names))
+            return
+        self._index_items(item_ids, names)
+
+    def prepare(self):
+        # Builds the index now rather than on the first search
+        self._ensure_built()
+
+    def _ensure_built(self):
+        if self._unindexed is not None:
+            items, self._unindexed = self._unindexed, None
+            self._index_items(items.keys(), items.values())
+
+    def _index_items(self, item_ids, names):
+        # Token lists are sorted once instead of insorting every token
+        grams = {}
+        id_tokens, name_tokens, word_tokens = [], [], []
+        for item_id, name in zip(item_ids, names):
+            key = item_id.lower()
+            name = str(name).lower()
+            self._names[item_id] = name
+            for gram in self._item_trigrams(key, name):
+                postings = grams.get(gram)
+                if postings is None:
+                    grams[gram] = [item_id]
+                else:
+                    postings.append(item_id)
+            id_tokens.append((key, item_id))
+            name_tokens.append((name, item_id))
+            word_tokens.extend((word, item_id) for word in set(name.split()))
+        for gram, postings in grams.items():
+            self._grams.setdefault(gram, set()).update(postings)
+        self._id_tokens = sorted(self._id_tokens + id_tokens)
+        self._name_tokens = sorted(self._name_tokens + name_tokens)
+        self._word_tokens = sorted(self._word_tokens + word_tokens)
+
+    def add(self, item_id, name):
+        if self._unindexed is not None:
+            self._unindexed[item_id] = name
+            return
+        key = item_id.lower()
+        name = str(name).lower()
+        self._names[item_id] = name
+        for gram in self._item_trigrams(key, name):
+            self._grams.setdefault(gram, set()).add(item_id)
+        bisect.insort(self._id_tokens, (key, item_id))
+        bisect.insort(self._name_tokens, (name, item_id))
+        for word in set(name.split()):
+            bisect.insort(self._word_tokens, (word, item_id))
+
+    def remove(self, item_id):
+        if self._unindexed is not None:
+            self._unindexed.pop(item_id, None)
+            return
+        name = self._names.pop(item_id, None)
+        if name is None:
+            return
+        key = item_id.lower()
+        for gram in self._item_trigrams(key, name):
+            postings = self._grams.get(gram)
+            if postings is not None:
+                postings.discard(item_id)
+                if not postings:
+                    del self._grams[gram]
+        self._remove_token(self._id_tokens, key, item_id)
+        self._remove_token(self._name_tokens, name, item_id)
+        for word in set(name.split()):
+            self._remove_token(self._word_tokens, word, item_id)
+
+    @staticmethod
+    def _remove_token(tokens, token, item_id):
+        position = bisect.bisect_left(tokens, (token, item_id))
+        if position < len(tokens) and tokens[position] == (token, item_id):
+            del tokens[position]
+
+    @staticmethod
+    def _prefix_matches(tokens, term):
+        position = bisect.bisect_left(tokens, (term,))
+        while position < len(tokens) and tokens[position][0].startswith(term):
+            yield tokens[position][1]
+            position += 1
+
+    def _substring_matches(self, term):
+        postings = sorted((self._grams.get(gram, set()) for gram in self._trigrams(term)), key=len)
+        if not postings[0]:
+            return []
+        # Every trigram being present doesn't guarantee the term itself is
+        candidates = set.intersection(*postings)
+        matches = [item_id for item_id in candidates
+                   if term in item_id.lower() or term in self._names[item_id]]
+        return sorted(matches, key=lambda item_id: (self._names[item_id], item_id))
+
+    def search(self, term, limit=None):
+        # Returns matching item IDs, best match first
+        term = term.strip().lower()
+        if not term:
+            return []
+        self._ensure_built()
+
+        ranks = [
+            self._prefix_matches(self._id_tokens, term),
+            self._prefix_matches(self._name_tokens, term),
+            self._prefix_matches(self._word_tokens, term),
+        ]
+        results = []
+        seen = set()
+        for matches in ranks:
+            for item_id in matches:
+                if item_id not in seen:
+                    seen.add(item_id)
+                    results.append(item_id)
+                    if limit is not None and len(results) >= limit:
+                        return results
+
+        if len(term) >= 3:
+            for item_id in self._substring_matches(term):
+                if item_id not in seen:
+                    seen.add(item_id)
+                    results.append(item_id)
+                    if limit is not None and len(results) >= limit:
+                        break
+        return results
+
+
+class ExpiryIndex:
+    # Item IDs ordered by expiration date. Dates are kept as YYYY-MM-DD strings, which
+    # sort the same way as the dates themselves, so range queries are just bisections.
+    def __init__(self):
+        self._entries = []  # sorted (date, item ID) pairs
+
+    def build(self, item_ids, dates):
+        self._entries = []
+        self.extend(item_ids, dates)
+
+    def extend(self, item_ids, dates):
+        # Bulk add; one sort instead of an insort per item
+        dates = pd.to_datetime(pd.Series(dates), errors='coerce').dt.strftime('%Y-%m-%d').to_numpy().tolist()
+        item_ids = pd.Series(item_ids, dtype=object).to_numpy().tolist()
+        self._entries = sorted(self._entries + [
+            (date, item_id) for item_id, date in zip(item_ids, dates) if isinstance(date, str)
+        ])
+
+    @staticmethod
+    def format_date(date):
+        # Stored dates aren't guaranteed to be normalized, so key on the parsed date
+        date = pd.to_datetime(date, errors='coerce')
+        return None if pd.isna(date) else date.strftime('%Y-%m-%d')
+
+    def add(self, item_id, date):
+        date = self.format_date(date)
+        if date is not None:
+            bisect.insort(self._entries, (date, item_id))
+
+    def remove(self, item_id, date):
+        date = self.format_date(date)
+        position = bisect.bisect_left(self._entries, (date, item_id)) if date is not None else len(self._entries)
+        if position < len(self._entries) and self._entries[position] == (date, item_id):
+            del self._entries[position]
+
+    def between(self, start=None, end=None):
+        # (date, item ID) pairs with start <= date < end; either bound may be left open
+        low = bisect.bisect_left(self._entries, (start,)) if start else 0
+        high = bisect.bisect_left(self._entries, (end,)) if end else len(self._entries)
+        return self._entries[low:high]
+
+    def expired(self, today=None):
+        today = today or datetime.now().date()
+        return self.between(end=today.strftime('%Y-%m-%d'))
+
+    def expiring_within(self, days, today=None):
+        # Not yet expired, but expiring within the next `days` days (inclusive)
+        today = today or datetime.now().date()
+        return self.between(today.strftime('%Y-%m-%d'), (today + timedelta(days=days + 1)).strftime('%Y-%m-%d'))
+
+
+# Sort key of lots without an expiration date, after every real date
+NO_EXPIRY = "9999-12-31"
+
+
+class StockLots:
+    # Each item's stock as lots with their own quantity and expiration date. An item's lots
+    # are a heap on the date, so a sale takes from the first-expiring lot (FEFO) in
+    # O(log lots). Lots of an item with the same date are merged, which makes (date, item
+    # ID) unique, and every dated lot is also in the ExpiryIndex, so expiry queries can
+    # report exact quantities. Most items have a single lot as loaded; those are kept as a
+    # (date, quantity) pair and only become a heap when their stock is first changed.
+    def __init__(self, expiry_index):
+        self.expiry_index = expiry_index
+        self._lots = {}  # item ID -> heap of [date, quantity]
+        self._single = {}  # item ID -> (date, quantity) of items not yet in _lots
+
+    @staticmethod
+    def _lot_frame(item_ids, quantities, dates):
+        # One row per (item ID, date), sorted by item and date
+        lots = pd.DataFrame({
+            'ID': pd.Series(item_ids).astype(str).to_numpy(),
+            'Quantity': pd.Series(quantities).astype(int).to_numpy(),
+            'Date': pd.to_datetime(pd.Series(dates), errors='coerce').dt.strftime('%Y-%m-%d').fillna(NO_EXPIRY).to_numpy(),
+        })
+        return lots[lots['Quantity'] > 0].groupby(['ID', 'Date'], as_index=False)['Quantity'].sum()
+
+    def build(self, item_ids, quantities, dates):
+        lots = self._lot_frame(item_ids, quantities, dates)
+        single = ~lots['ID'].duplicated(keep=False).to_numpy()
+        self._single = dict(zip(lots['ID'].to_numpy()[single].tolist(), zip(
+            lots['Date'].to_numpy()[single].tolist(), lots['Quantity'].to_numpy()[single].tolist())))
+        self._lots = {}
+        self.expiry_index.build([], [])
+        self._add_lots(lots[~single])
+        dated = (lots['Date'] != NO_EXPIRY).to_numpy() & single
+        self.expiry_index.extend(lots['ID'].to_numpy()[dated], lots['Date'].to_numpy()[dated])
+
+    def extend(self, item_ids, quantities, dates):
+        # Bulk add; the expiry index is extended in one go instead of an insort per lot
+        self._add_lots(self._lot_frame(item_ids, quantities, dates))
+
+    def _add_lots(self, lots):
+        added_ids, added_dates = [], []
+        # Sorted by item and date, so new items' lists come out as valid heaps
+        for item_id, date, quantity in zip(lots['ID'].to_numpy().tolist(), lots['Date'].to_numpy().tolist(),
+                                           lots['Quantity'].to_numpy().tolist()):
+            heap = self._heap(item_id)
+            if heap is None:
+                self._lots[item_id] = [[date, quantity]]
+            elif not self._merge(heap, date, quantity):
+                heapq.heappush(heap, [date, quantity])
+            else:
+                continue
+            if date != NO_EXPIRY:
+                added_ids.append(item_id)
+                added_dates.append(date)
+        self.expiry_index.extend(added_ids, added_dates)
+
+    def _heap(self, item_id):
+        # The item's heap, made from its single lot the first time it is needed; None if it
+        # has no lots
+        heap = self._lots.get(item_id)
+        if heap is None:
+            single = self._single.pop(item_id, None)
+            if single is not None:
+                heap = self._lots[item_id] = [list(single)]
+        return heap
+
+    def _peek(self, item_id):
+        # The item's [date, quantity] lots in heap order, without making a heap
+        heap = self._lots.get(item_id)
+        if heap is not None:
+            return heap
+        single = self._single.get(item_id)
+        return [single] if single is not None else []
+
+    @staticmethod
+    def _merge(heap, date, quantity):
+        for lot in heap:
+            if lot[0] == date:
+                lot[1] += quantity
+                return True
+        return False
+
+    def lots(self, item_id):
+        # [(expiration date or None, quantity)], first to expire first
+        return [(None if date == NO_EXPIRY else date, quantity) for date, quantity in sorted(self._peek(item_id))]
+
+    def lot_quantity(self, item_id, date):
+        for lot_date, quantity in self._peek(item_id):
+            if lot_date == date:
+                return quantity
+        return 0
+
+    def earliest(self, item_id):
+        # Expiration date of the item's first-expiring lot, or None
+        heap = self._peek(item_id)
+        if not heap or heap[0][0] == NO_EXPIRY:
+            return None
+        return heap[0][0]
+
+    def receive(self, item_id, quantity, date):
+        date = ExpiryIndex.format_date(date) or NO_EXPIRY
+        if quantity <= 0:
+            return
+        heap = self._heap(item_id)
+        if heap is None:
+            heap = self._lots[item_id] = []
+        if self._merge(heap, date, quantity):
+            return
+        heapq.heappush(heap, [date, quantity])
+        if date != NO_EXPIRY:
+            self.expiry_index.add(item_id, date)
+
+    def take(self, item_id, quantity):
+        # Takes quantity first-expiring-first-out (or all there is, if that is less) and
+        # returns the (date, quantity) taken from each lot, for give_back()
+        heap = self._heap(item_id) or []
+        taken = []
+        while quantity > 0 and heap:
+            lot = heap[0]
+            used = min(quantity, lot[1])
+            lot[1] -= used
+            quantity -= used
+            taken.append((lot[0], used))
+            if lot[1] == 0:
+                heapq.heappop(heap)
+                if lot[0] != NO_EXPIRY:
+                    self.expiry_index.remove(item_id, lot[0])
+        if not heap:
+            self._lots.pop(item_id, None)
+        return taken
+
+    def give_back(self, item_id, taken):
+        for date, quantity in taken:
+            self.receive(item_id, quantity, date)
+
+    def set_quantity(self, item_id, quantity, date):
+        # Brings the lots to `quantity`: a surplus is taken first-expiring-first-out, as a
+        # sale would, and a shortfall becomes a lot expiring on `date`
+        difference = quantity - sum(lot[1] for lot in self._peek(item_id))
+        if difference < 0:
+            self.take(item_id, -difference)
+        else:
+            self.receive(item_id, difference, date)
+
+    def redate(self, item_id, date):
+        # Moves the first-expiring lot to another date, e.g. to correct a mistyped date
+        heap = self._heap(item_id)
+        if not heap:
+            return
+        old_date, quantity = heapq.heappop(heap)
+        if old_date != NO_EXPIRY:
+            self.expiry_index.remove(item_id, old_date)
+        self.receive(item_id, quantity, date)
+
+    def replace(self, item_id, lots):
+        # lots: [(quantity, expiration date or None)]
+        self.drop(item_id)
+        for quantity, date in lots:
+            self.receive(item_id, int(quantity), date)
+
+    def drop(self, item_id):
+        self._heap(item_id)
+        for date, _ in self._lots.pop(item_id, []):
+            if date != NO_EXPIRY:
+                self.expiry_index.remove(item_id, date)
+
+    def records(self, item_ids):
+        # {item ID: [(quantity, expiration date or None)]}, as storage.update_lots() takes them
+        return {item_id: [(quantity, date) for date, quantity in self.lots(item_id)] for item_id in item_ids}
+
+    def rows(self):
+        return ([[item_id, quantity, date] for item_id in self._lots for date, quantity in self.lots(item_id)]
+                + [[item_id, quantity, None if date == NO_EXPIRY else date]
+                   for item_id, (date, quantity) in self._single.items()])
+
+
+class Inventory(ChangeNotifier):
+    def __init__(self, storage=None):
+        self.storage = storage or create_storage()
+        self._listeners = []
+        self.load_inventory()
+
+    @timed
+    def load_inventory(self):
+        # Typed as in schema.py, with the IDs stripped, so lookups never re-cast the column
+        self.data = self.storage.load_inventory()
+        self.build_index()
+
+        # Optimistic versioning: every change to an item gives it the next inventory
+        # version. Items unchanged since loading are at version 0. change_log lists
+        # (version, item ID) in order, and _change_versions just the versions, so changes
+        # since a version can be looked up by bisecting it.
+        self.version = 0
+        self.versions = {}
+        self.change_log = []
+        self._change_versions = []
+
+    def bump_versions(self, item_ids):
+        for item_id in item_ids:
+            self.version += 1
+            self.versions[item_id] = self.version
+            self.change_log.append((self.version, item_id))
+            self._change_versions.append(self.version)
+
+    def get_version(self, item_id):
+        return self.versions.get(str(item_id).strip(), 0)
+
+    def changed_since(self, version):
+        # IDs of the items added, changed or deleted after `version`, oldest change first
+        start = bisect.bisect_right(self._change_versions, version)
+        return list(dict.fromkeys(item_id for _, item_id in self.change_log[start:]))
+
+    def check_version(self, item_id, version):
+        # None if the item is still at `version` (or no version is given), else an error
+        if version is not None and self.get_version(item_id) != int(version):
+            return f"Item ID '{str(item_id).strip()}' was changed on another terminal. Reload it and try again."
+        return None
+
+    def build_index(self):
+        # Maps each item ID to its row label in self.data
+        self._index = dict(zip(self.data['ID'], self.data.index))
+        self._next_label = int(self.data.index.max()) + 1 if len(self.data) else 0
+
+        self.search_index = SearchIndex()
+        self.search_index.build(self.data['ID'].tolist(), self.data['Name'].tolist())
+        self.expiry_index = ExpiryIndex()
+        self.lots = StockLots(self.expiry_index)
+        self.load_lots()
+
+    def load_lots(self):
+        # The inventory quantities are what counts. Items without stored lots are one lot as
+        # their row describes. Where stored lots don't add up to the quantity (they are
+        # written separately, or another instance changed the stock) the surplus is taken
+        # off first-expiring-first-out, as a sale would have, and a shortfall is added at
+        # the row's date. Rows then show their first-expiring lot's date.
+        stored = self.storage.load_lots()
+        stored['Item ID'] = stored['Item ID'].astype(str).str.strip()
+        stored = stored[stored['Item ID'].isin(self._index.keys())]
+        unlotted = self.data[~self.data['ID'].isin(stored['Item ID'])]
+        self.lots.build(
+            pd.concat([stored['Item ID'], unlotted['ID']], ignore_index=True),
+            pd.concat([stored['Quantity'].astype(int), unlotted['Quantity'].astype(int)], ignore_index=True),
+            pd.concat([stored['Expiration Date'].astype(object), pd.Series(format_dates(unlotted['Expiration Date']))],
+                      ignore_index=True),
+        )
+
+        lotted = stored['Item ID'].unique().tolist()
+        if not lotted:
+            return
+        labels = [self._index[item_id] for item_id in lotted]
+        totals = stored.groupby('Item ID', sort=False)['Quantity'].sum().loc[lotted].to_numpy().astype(int)
+        quantities = self.data.loc[labels, 'Quantity'].to_numpy().astype(int)
+        for position in (totals != quantities).nonzero()[0].tolist():
+            self.lots.set_quantity(lotted[position], int(quantities[position]),
+                                   self.data.at[labels[position], 'Expiration Date'])
+        earliest = [(label, self.lots.earliest(item_id)) for label, item_id in zip(labels, lotted)]
+        earliest = [(label, date) for label, date in earliest if date is not None]
+        if earliest:
+            self.data.loc[[label for label, _ in earliest], 'Expiration Date'] = parse_dates(
+                [date for _, date in earliest])
+
+    def save_lots(self, item_ids):
+        self.storage.update_lots(self.lots.records(item_ids))
+
+    @timed
+    def refresh(self):
+        # Picks up changes other processes made to the stored inventory; returns True if
+        # there were any
+        data = self.storage.poll_inventory()
+        if data is None:
+            return False
+        self.merge(data)
+        return True
+
+    @timed
+    def merge(self, data):
+        # Makes self.data match `data` while keeping the rows that didn't change where they
+        # are, so listeners get a ChangeEvent for just the rows that differ
+        columns = ['Name', 'Quantity', 'Expiration Date']
+        data = data.drop_duplicates('ID', keep='last').set_index('ID')
+
+        kept = self.data['ID'].isin(data.index)
+        removed = (~kept).to_numpy().nonzero()[0].tolist()
+        current = self.data[kept]
+        fresh = data.loc[current['ID']]
+        differs = (current[columns].astype(str).to_numpy() != fresh[columns].astype(str).to_numpy()).any(axis=1)
+        updated = differs.nonzero()[0].tolist()
+        added = data[~data.index.isin(self.data['ID'])].reset_index()
+        added.index = range(self._next_label, self._next_label + len(added))
+
+        changed_ids = []
+        for position in removed:
+            item_id = self.data['ID'].iat[position]
+            self.search_index.remove(item_id)
+            self.lots.drop(item_id)
+            changed_ids.append(item_id)
+        for position in updated:
+            item_id = current['ID'].iat[position]
+            if current['Name'].iat[position] != fresh['Name'].iat[position]:
+                self.search_index.remove(item_id)
+                self.search_index.add(item_id, fresh['Name'].iat[position])
+            changed_ids.append(item_id)
+        for column in columns:
+            current.loc[current.index[differs], column] = fresh[column].to_numpy()[differs]
+        for item_id, name in zip(added['ID'], added['Name']):
+            self.search_index.add(item_id, name)
+            changed_ids.append(item_id)
+
+        # The other instance stored the lots of the items it changed
+        restocked = [current['ID'].iat[position] for position in updated] + added['ID'].tolist()
+        if restocked:
+            stored = self.storage.load_lots()
+            stored['Item ID'] = stored['Item ID'].astype(str).str.strip()
+            stored = stored[stored['Item ID'].isin(restocked)].astype(object)
+            stored = stored.where(stored.notna(), None)
+            stored_lots = {item_id: list(zip(group['Quantity'], group['Expiration Date']))
+                           for item_id, group in stored.groupby('Item ID', sort=False)}
+            for item_id in restocked:
+                quantity, expiration_date = data.at[item_id, 'Quantity'], data.at[item_id, 'Expiration Date']
+                self.lots.replace(item_id, stored_lots.get(item_id, [(quantity, expiration_date)]))
+                self.lots.set_quantity(item_id, int(quantity), expiration_date)
+
+        self.data = pd.concat([current, added[INVENTORY_COLUMNS]])
+        self._index = dict(zip(self.data['ID'], self.data.index))
+        self._next_label += len(added)
+        self.bump_versions(changed_ids)
+        self.notify(inserted=range(len(current), len(self.data)), updated=updated, removed=removed)
+
+    @timed
+    def save_inventory(self):
+        self.storage.save_inventory(self.data)
+
+    def has_item(self, item_id):
+        return str(item_id).strip() in self._index
+
+    def label_of(self, item_id):
+        # Returns the row label of item_id in data, or None if there is no such item
+        return self._index.get(str(item_id).strip())
+
+    def get_item(self, item_id):
+        # Returns the inventory row for item_id, or None if there is no such item
+        label = self.label_of(item_id)
+        if label is None:
+            return None
+        return self.data.loc[label]
+
+    def get_quantity(self, item_id):
+        label = self.label_of(item_id)
+        if label is None:
+            return None
+        return int(self.data.at[label, 'Quantity'])
+
+    @timed
+    def check_stock(self, item_ids, quantities):
+        # Vectorized stock check for a cart. Repeated IDs are summed. Returns
+        # (row labels, cart totals, current quantities, error message or None).
+        cart = pd.DataFrame({'ID': [str(item_id).strip() for item_id in item_ids], 'Quantity': quantities})
+        totals = cart.groupby('ID', sort=False)['Quantity'].sum()
+
+        labels = [self._index.get(item_id) for item_id in totals.index]
+        missing = [item_id for item_id, label in zip(totals.index, labels) if label is None]
+        if missing:
+            return None, None, None, f"Item ID '{missing[0]}' not found in inventory!"
+
+        current = self.data.loc[labels, 'Quantity'].to_numpy()
+        short = totals.index[totals.to_numpy() > current]
+        if len(short):
+            return None, None, None, f"Not enough stock available for item ID '{short[0]}'!"
+        return labels, totals, current, None
+
+    def set_quantities(self, labels, quantities, dates=None):
+        # In-memory only; callers persist the change (see Sales.record_sales_batch)
+        self.data.loc[labels, 'Quantity'] = np.asarray(quantities, dtype=np.int32)
+        if dates is not None:
+            self.data.loc[labels, 'Expiration Date'] = parse_dates(dates)
+
+    def _set_item(self, label, changes):
+        # changes are as stored, with dates as text; the frame keeps the schema's types
+        for column, value in changes.items():
+            self.data.at[label, column] = pd.Timestamp(value) if column == 'Expiration Date' else value
+
+    @timed
+    def add_item(self, item_id, name, quantity, expiration_date):
+        item_id = str(item_id).strip()
+
+        # Check if item with the same ID already exists
+        if item_id in self._index:
+            return False, "An item with this ID already exists."
+
+        # Convert the expiration_date to datetime and then back to string in YYYY-MM-DD format
+        try:
+            date_obj = pd.to_datetime(expiration_date).date()
+            formatted_date = date_obj.strftime('%Y-%m-%d')
+        except ValueError:
+            return False, "Invalid date format. Use YYYY-MM-DD."
+
+        label = self._next_label
+        row = [item_id, name, int(quantity), formatted_date]
+        new_item = pd.DataFrame([row], columns=INVENTORY_COLUMNS, index=[label]).astype(self.data.dtypes)
+        self.data = pd.concat([self.data, new_item])
+        self._index[item_id] = label
+        self._next_label += 1
+        self.search_index.add(item_id, name)
+        self.lots.receive(item_id, int(quantity), formatted_date)
+        self.storage.insert_item(row, self.data)
+        self.bump_versions([item_id])
+        self.notify(inserted=[len(self.data) - 1])
+        return True, "Item added successfully."
+
+    @timed
+    def edit_item(self, item_id, quantity=None, expiration_date=None, version=None):
+        # With a version, the edit only goes through if nobody changed the item since then
+        label = self._index.get(str(item_id).strip())
+        if label is None:
+            return False, "Item not found."
+        conflict = self.check_version(item_id, version)
+        if conflict:
+            return False, conflict
+
+        if quantity is not None:
+            try:
+                quantity = int(quantity)
+            except ValueError:
+                return False, "Quantity must be an integer."
+        if expiration_date is not None:
+            # Ensure the expiration date is in YYYY-MM-DD format
+            try:
+                date_obj = pd.to_datetime(expiration_date).date()
+                expiration_date = date_obj.strftime('%Y-%m-%d')
+            except ValueError:
+                return False, "Invalid date format. Use YYYY-MM-DD."
+
+        changes = {}
+        item_id = self.data.at[label, 'ID']
+        if expiration_date is not None:
+            # A corrected date for the first-expiring lot
+            changes['Expiration Date'] = expiration_date
+            self.lots.redate(item_id, expiration_date)
+        if quantity is not None:
+            # A counted quantity
+            changes['Quantity'] = quantity
+            self.lots.set_quantity(item_id, quantity, expiration_date or self.data.at[label, 'Expiration Date'])
+        earliest = self.lots.earliest(item_id)
+        if earliest is not None and (expiration_date is not None or
+                                     earliest != ExpiryIndex.format_date(self.data.at[label, 'Expiration Date'])):
+            changes['Expiration Date'] = earliest
+        self._set_item(label, changes)
+        if changes:
+            self.save_lots([item_id])
+            self.storage.update_item(self.data.at[label, 'ID'], changes, self.data)
+            self.bump_versions([self.data.at[label, 'ID']])
+            self.notify(updated=[self.data.index.get_loc(label)])
+        return True, "Item updated successfully."
+
+    @timed
+    def delete_item(self, item_id, version=None):
+        if not self.has_item(item_id):
+            return False, "Item not found."
+        conflict = self.check_version(item_id, version)
+        if conflict:
+            return False, conflict
+        label = self._index.pop(str(item_id).strip())
+        position = self.data.index.get_loc(label)
+        self.lots.drop(str(item_id).strip())
+        self.data = self.data.drop(index=label)
+        self.search_index.remove(str(item_id).strip())
+        self.save_lots([str(item_id).strip()])
+        self.storage.delete_item(str(item_id).strip(), self.data)
+        self.bump_versions([str(item_id).strip()])
+        self.notify(removed=[position])
+        return True, "Item deleted successfully."
+
+    @timed
+    def receive_lot(self, item_id, quantity, expiration_date):
+        # A restock of an existing item, kept as its own lot with its own expiration date
+        label = self._index.get(str(item_id).strip())
+        if label is None:
+            return False, "Item not found."
+        try:
+            quantity = int(quantity)
+        except ValueError:
+            return False, "Quantity must be an integer."
+        if quantity <= 0:
+            return False, "Quantity must be a positive integer."
+        try:
+            expiration_date = pd.to_datetime(expiration_date).date().strftime('%Y-%m-%d')
+        except ValueError:
+            return False, "Invalid date format. Use YYYY-MM-DD."
+
+        item_id = self.data.at[label, 'ID']
+        self.lots.receive(item_id, quantity, expiration_date)
+        changes = {'Quantity': int(self.data.at[label, 'Quantity']) + quantity,
+                   'Expiration Date': self.lots.earliest(item_id)}
+        self._set_item(label, changes)
+        self.save_lots([item_id])
+        self.storage.update_item(item_id, changes, self.data)
+        self.bump_versions([item_id])
+        self.notify(updated=[self.data.index.get_loc(label)])
+        return True, f"Received {quantity} units expiring {expiration_date}."
+
+    @timed
+    def import_delivery(self, path, chunk_rows=IMPORT_CHUNK_ROWS):
+        # Bulk import of a supplier delivery file with the inventory columns. Rows for
+        # existing items top up their quantity with new lots, rows
+        # for new IDs add items, and repeated IDs are combined. The file is read and
+        # validated a chunk at a time, and the inventory is stored once at the end.
+        # Returns (success, message, rejections): the rejected rows with their line number
+        # in the file and the reason.
+        no_rejections = pd.DataFrame(columns=IMPORT_REJECTION_COLUMNS)
+        rejections = []
+        accepted = []
+        try:
+            for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+                chunk.columns = chunk.columns.str.strip()
+                missing = [column for column in INVENTORY_COLUMNS if column not in chunk.columns]
+                if missing:
+                    return False, f"The file has no {', '.join(missing)} column.", no_rejections
+                chunk_accepted, chunk_rejections = self._validate_delivery(chunk)
+                accepted.append(chunk_accepted)
+                rejections.append(chunk_rejections)
+        except (OSError, ValueError) as e:
+            return False, f"Could not read {path}: {e}", no_rejections
+
+        rejections = pd.concat(rejections, ignore_index=True) if rejections else no_rejections
+        accepted = [chunk for chunk in accepted if not chunk.empty]
+        if not accepted:
+            return True, f"Nothing imported; {len(rejections)} rows rejected.", rejections
+        accepted = pd.concat(accepted, ignore_index=True)
+        delivery = accepted.groupby('ID', sort=False).agg({'Name': 'first', 'Quantity': 'sum', 'Expiration Date': 'min'})
+        delivered_dates = delivery['Expiration Date'].dt.strftime('%Y-%m-%d').to_numpy()
+
+        # Top-ups for items we already have
+        existing = delivery.index.isin(self._index.keys())
+        top_up_ids = delivery.index[existing]
+        labels = [self._index[item_id] for item_id in top_up_ids]
+        added = delivery['Quantity'].to_numpy()[existing]
+        self.data.loc[labels, 'Quantity'] = (self.data.loc[labels, 'Quantity'].to_numpy() + added).astype(np.int32)
+        top_up_dates = delivered_dates[existing]
+
+        # New items, added in one go
+        new = delivery[~existing]
+        new_items = inventory_frame(pd.DataFrame({
+            'ID': new.index,
+            'Name': new['Name'].to_numpy(),
+            'Quantity': new['Quantity'].to_numpy(),
+            'Expiration Date': new['Expiration Date'].to_numpy(),
+        }, index=range(self._next_label, self._next_label + len(new))))
+        first_new = len(self.data)
+        if len(new_items):
+            self.data = pd.concat([self.data, new_items])
+            self._index.update(zip(new_items['ID'], new_items.index))
+            self._next_label += len(new_items)
+            self.search_index.build(new_items['ID'], new_items['Name'])
+
+        # Every (item, expiration date) delivered is a lot; top-ups without a date join the
+        # item's first-expiring lot. Rows then show their first-expiring lot's date.
+        lots = accepted.groupby(['ID', 'Expiration Date'], sort=False, dropna=False)['Quantity'].sum()
+        lot_ids = lots.index.get_level_values('ID')
+        lot_dates = lots.index.get_level_values('Expiration Date').strftime('%Y-%m-%d').to_numpy(dtype=object)
+        undated = pd.isna(lot_dates)
+        lot_dates[undated] = [ExpiryIndex.format_date(self.data.at[self._index[item_id], 'Expiration Date'])
+                              for item_id in lot_ids[undated]]
+        self.lots.extend(lot_ids, lots.to_numpy(), lot_dates)
+        for label, item_id in zip(labels, top_up_ids):
+            earliest = self.lots.earliest(item_id)
+            if earliest is not None:
+                self.data.at[label, 'Expiration Date'] = pd.Timestamp(earliest)
+
+        top_ups = [(item_id, int(quantity), date if isinstance(date, str) else None)
+                   for item_id, quantity, date in zip(top_up_ids, added, top_up_dates)]
+        # New items delivered with a single date are one lot as their row describes
+        self.save_lots(list(top_up_ids) + list(dict.fromkeys(lot_ids[lot_ids.duplicated() & ~lot_ids.isin(top_up_ids)])))
+        self.storage.import_items(top_ups, inventory_records(new_items).values.tolist(), self.data)
+        self.bump_versions(list(top_up_ids) + list(new_items['ID']))
+        self.notify(inserted=range(first_new, len(self.data)),
+                    updated=[self.data.index.get_loc(label) for label in labels])
+        return True, (f"Imported {len(new_items)} new items and topped up {len(top_ups)} items; "
+                      f"{len(rejections)} rows rejected."), rejections
+
+    def _validate_delivery(self, chunk):
+        # Vectorized checks for one chunk of a delivery file. Returns the accepted rows
+        # (ID, Name, Quantity, Expiration Date as a datetime) and the rejections.
+        item_ids = chunk['ID'].str.strip()
+        names = chunk['Name'].str.strip()
+        quantities = pd.to_numeric(chunk['Quantity'].str.strip(), errors='coerce')
+        date_text = chunk['Expiration Date'].str.strip()
+        dates = pd.to_datetime(date_text, format='%Y-%m-%d', errors='coerce')
+        new = ~item_ids.isin(self._index.keys())
+
+        # Each row gets the reason of the first check it fails
+        checks = [
+            (item_ids == '', "Missing item ID"),
+            (quantities.isna(), "Quantity is not a number"),
+            ((quantities <= 0) | (quantities % 1 != 0), "Quantity must be a positive integer"),
+            ((date_text != '') & dates.isna(), "Invalid expiration date, use YYYY-MM-DD"),
+            (new & (names == ''), "Missing name for a new item"),
+            (new & (date_text == ''), "Missing expiration date for a new item"),
+        ]
+        reasons = pd.Series('', index=chunk.index)
+        for failed, reason in reversed(checks):
+            reasons = reasons.mask(failed, reason)
+        rejected = (reasons != '').to_numpy()
+
+        rejections = pd.DataFrame({
+            # Line numbers in the file: the header is line 1 and the chunks continue the index
+            'Line': chunk.index[rejected] + 2,
+            'ID': item_ids[rejected].to_numpy(),
+            'Reason': reasons[rejected].to_numpy(),
+        }, columns=IMPORT_REJECTION_COLUMNS)
+        accepted = pd.DataFrame({
+            'ID': item_ids[~rejected].to_numpy(),
+            'Name': names[~rejected].to_numpy(),
+            'Quantity': quantities[~rejected].to_numpy().astype(int),
+            'Expiration Date': dates[~rejected].to_numpy(),
+        })
+        return accepted, rejections
+
+    def get_inventory(self):
+        return self.data
+
+    @timed
+    def search_inventory(self, search_term, limit=None):
+        # Matching rows, best match first; the term is plain text, not a regex
+        item_ids = self.search_index.search(search_term, limit)
+        return self.data.loc[[self._index[item_id] for item_id in item_ids]]
+
+    @timed
+    def check_expirations(self, days=EXPIRY_WARNING_DAYS):
+        # Items that have expired or expire within `days` days, soonest first
+        entries = self.expiry_index.between(end=(datetime.now().date() + timedelta(days=days + 1)).strftime('%Y-%m-%d'))
+        return self.data.loc[[self._index[item_id] for item_id in dict.fromkeys(item_id for _, item_id in entries)]]
+
+    @timed
+    def expiring_lots(self, days=EXPIRY_WARNING_DAYS):
+        # Lots that have expired or expire within `days` days, soonest first, with the
+        # quantity in each lot rather than the item's whole stock
+        entries = self.expiry_index.between(end=(datetime.now().date() + timedelta(days=days + 1)).strftime('%Y-%m-%d'))
+        item_ids = [item_id for _, item_id in entries]
+        return pd.DataFrame({
+            'ID': item_ids,
+            'Name': self.data.loc[[self._index[item_id] for item_id in item_ids], 'Name'].to_numpy(),
+            'Quantity': [self.lots.lot_quantity(item_id, date) for date, item_id in entries],
+            'Expiration Date': [date for date, _ in entries],
+        }, columns=INVENTORY_COLUMNS)
+
+
+class Sales(ChangeNotifier):
+    def __init__(self, storage=None):
+        self.storage = storage or create_storage()
+        self._listeners = []
+        self.load_sales()
+
+    @timed
+    def load_sales(self):
+        self.sales_data = self.storage.load_sales()
+        # Months of history held in memory, or None when the backend loads everything
+        self.loaded_months = None
+        if self.storage.sales_months() is not None:
+            self.loaded_months = set(self._months_of(self.sales_data)) | {current_month()}
+
+    @staticmethod
+    def _months_of(sales_data):
+        return pd.Series(months_of(sales_data['Timestamp']), index=sales_data.index)
+
+    def months(self):
+        # Every month with sales, loaded or not; None when the history isn't partitioned
+        return self.storage.sales_months()
+
+    @timed
+    def load_months(self, months):
+        # Replaces the loaded history with the given months (the current month always stays
+        # loaded). Months already in memory are kept from the buffer, the rest are read from
+        # storage. This swaps the whole frame, so no change event is sent: views reload.
+        if self.loaded_months is None:
+            return
+        months = set(months) | {current_month()}
+        sales_months = self._months_of(self.sales_data)
+        frames = []
+        for month in sorted(months):
+            if month in self.loaded_months:
+                frames.append(self.sales_data[(sales_months == month).to_numpy()])
+            else:
+                frames.append(self.storage.load_sales_partition(month))
+        frames = [frame for frame in frames if not frame.empty]
+        self.sales_data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SALES_COLUMNS)
+        self.loaded_months = months
+
+    def load_range(self, start=None, end=None):
+        # Loads just the months that overlap [start, end] (YYYY-MM-DD, either may be open)
+        months = self.months()
+        if months is None:
+            return
+        self.load_months(month for month in months
+                         if (not start or month >= start[:7]) and (not end or month <= end[:7]))
+
+    def load_older_month(self):
+        # Pages in the newest month older than everything loaded; returns it, or None
+        months = self.months()
+        if months is None:
+            return None
+        oldest = min(self.loaded_months)
+        older = [month for month in months if month < oldest]
+        if not older:
+            return None
+        self.load_months(self.loaded_months | {older[-1]})
+        return older[-1]
+
+    def history_chunks(self, since=None, before=None):
+        # The history in date order, one month at a time when it is partitioned, so reports
+        # can be built without holding every month in memory. Partitioned history can be
+        # limited to the months from `since` up to, not including, `before` (YYYY-MM).
+        months = self.months()
+        if months is None:
+            yield self.sales_data
+            return
+        sales_months = self._months_of(self.sales_data)
+        for month in sorted(set(months) | self.loaded_months):
+            if (since and month < since) or (before and month >= before):
+                continue
+            if month in self.loaded_months:
+                yield self.sales_data[(sales_months == month).to_numpy()]
+            else:
+                yield self.storage.load_sales_partition(month)
+
+    @property
+    def sales_data(self):
+        # Only the first _size rows of the buffer hold sales, the rest is spare capacity
+        return self._buffer.iloc[:self._size]
+
+    @sales_data.setter
+    def sales_data(self, sales_data):
+        # Frames from storage are already typed; months concatenated by load_months() have
+        # their categories merged again
+        sales_data = sales_frame(sales_data)
+        # Nullable integers so the spare capacity doesn't turn quantities into floats
+        sales_data["Quantity"] = sales_data["Quantity"].astype("Int32")
+        self._buffer = sales_data
+        self._size = len(sales_data)
+
+    def _append_rows(self, rows):
+        # Rows are as stored: (item ID, name, quantity, date, time)
+        # Grow the buffer geometrically so appending a sale is amortized O(1)
+        needed = self._size + len(rows)
+        if needed > len(self._buffer):
+            capacity = max(needed, 2 * len(self._buffer), SALES_CHUNK_ROWS)
+            self._buffer = self._buffer.reindex(range(capacity))
+        # IDs and names are categorical; make room for new values, once per column
+        for position, column in enumerate(('Item ID', 'Item Name')):
+            categories = self._buffer[column].cat.categories
+            new = [value for value in dict.fromkeys(row[position] for row in rows)
+                   if pd.notna(value) and value not in categories]
+            if new:
+                self._buffer[column] = self._buffer[column].cat.add_categories(new)
+        for row in rows:
+            values = (row[0], row[1], row[2], pd.Timestamp(f"{row[3]} {row[4]}"))
+            for column, value in enumerate(values):
+                self._buffer.iat[self._size, column] = value
+            self._size += 1
+            if self.loaded_months is not None:
+                self.loaded_months.add(row[3][:7])
+
+    def close(self):
+        self.storage.close()
+
+    @timed
+    def refresh(self):
+        # Picks up sales other processes stored. New rows are appended with a change event;
+        # returns True if the history was rewritten and had to be loaded again instead, in
+        # which case views have to be rebuilt.
+        rows, reloaded = self.storage.poll_sales()
+        if reloaded:
+            self.load_sales()
+            return True
+        if rows is not None and len(rows):
+            rows['Item ID'] = rows['Item ID'].astype(str).str.strip()
+            first_row = self._size
+            self._append_rows([list(row) for row in rows[SALES_COLUMNS].itertuples(index=False, name=None)])
+            self.notify(inserted=range(first_row, self._size))
+        return False
+
+    @timed
+    def save_sales(self):
+        self.storage.save_sales(self.sales_data)
+
+    @timed
+    def compact(self):
+        # Explicit compaction step: folds the journal (or WAL) back into the main store
+        self.storage.compact_sales(self.sales_data)
+        self.checkpoint()
+
+    @timed
+    def checkpoint(self):
+        # Write a columnar snapshot so the next start only parses newer journal rows
+        self.storage.checkpoint_sales(self.sales_data)
+
+    @timed
+    def record_sale(self, item_id, item_name, quantity):
+        now = datetime.now()
+        sale_date = now.strftime("%Y-%m-%d")
+        sale_time = now.strftime("%H:%M:%S")
+
+        row = [str(item_id).strip(), item_name, int(quantity), sale_date, sale_time]
+        self._append_rows([row])
+        self.storage.append_sales([row], self.sales_data)
+        self.notify(inserted=[self._size - 1])
+
+    @timed
+    def record_sales_batch(self, inventory, lines, versions=None):
+        # Checks out a cart of (item ID, quantity) lines: stock is validated for all lines
+        # at once, then the inventory decrements and the sale rows are stored together,
+        # or not at all. versions optionally maps item IDs to the versions the seller saw.
+        if not lines:
+            return False, "The cart is empty."
+        for item_id, version in (versions or {}).items():
+            conflict = inventory.check_version(item_id, version)
+            if conflict:
+                return False, conflict
+        item_ids = [str(item_id).strip() for item_id, _ in lines]
+        try:
+            quantities = [int(quantity) for _, quantity in lines]
+        except ValueError:
+            return False, "Quantity must be a positive integer!"
+        if min(quantities) <= 0:
+            return False, "Quantity must be a positive integer!"
+
+        labels, totals, current, error = inventory.check_stock(item_ids, quantities)
+        if error:
+            return False, error
+
+        now = datetime.now()
+        sale_date = now.strftime("%Y-%m-%d")
+        sale_time = now.strftime("%H:%M:%S")
+        names = inventory.data.loc[[inventory.label_of(item_id) for item_id in item_ids], 'Name'].tolist()
+        rows = [[item_id, name, quantity, sale_date, sale_time]
+                for item_id, name, quantity in zip(item_ids, names, quantities)]
+        new_quantities = current - totals.to_numpy()
+        # Stock leaves first-expiring-first-out, and the rows move on to the date of the
+        # next lot once a lot is used up
+        taken = {item_id: inventory.lots.take(item_id, int(total)) for item_id, total in totals.items()}
+        dates = inventory.data.loc[labels, 'Expiration Date'].tolist()
+        new_dates = [inventory.lots.earliest(item_id) or ExpiryIndex.format_date(date)
+                     for item_id, date in zip(totals.index, dates)]
+        updates = list(zip(totals.index, new_quantities.tolist(), new_dates))
+
+        first_row = self._size
+        inventory.set_quantities(labels, new_quantities, new_dates)
+        self._append_rows(rows)
+        try:
+            # The lots left go out with the sale, so stock, lots and sales are stored together
+            self.storage.record_sales_batch(updates, rows, inventory.data, self.sales_data,
+                                            inventory.lots.records(totals.index))
+        except Exception as e:
+            # Roll the in-memory state back to match what is stored
+            inventory.set_quantities(labels, current, dates)
+            for item_id, lots in taken.items():
+                inventory.lots.give_back(item_id, lots)
+            self._size = first_row
+            return False, f"Could not record the sale: {e}"
+
+        inventory.bump_versions(totals.index)
+        inventory.notify(updated=[inventory.data.index.get_loc(label) for label in labels])
+        self.notify(inserted=range(first_row, self._size))
+        return True, "Sale recorded successfully!"
+
+def load_models():
+    # (storage, inventory, sales, analytics, forecast) for the app. Nothing here touches Tk, so
+    # startup.py runs it on a background thread while the login window is up.
+    if USE_SERVICE:
+        # Imported here: service.py builds on the models in this module
+        from service import RemoteInventory, RemoteSales, RemoteStorage
+        storage = RemoteStorage(SERVICE_HOST, SERVICE_PORT)
+        inventory = RemoteInventory(storage)
+        sales = RemoteSales(storage)
+    else:
+        storage = create_storage(write_behind=WRITE_BEHIND)
+        inventory = Inventory(storage)
+        sales = Sales(storage)
+    # Not left to the first search, which runs on the Tk thread
+    inventory.search_index.prepare()
+    analytics = SalesAnalytics(sales)
+    return storage, inventory, sales, analytics, StockForecast(inventory, analytics)
@@ -0,0 +1,130 @@
+# Column schema of the inventory and sales frames.
+#
+# The files and tables keep their format (dates and times as text), but the frames the
+# models hold are typed. Storage backends convert what they load with inventory_frame()
+# and sales_frame(), and convert whole frames back with inventory_records() and
+# sales_records() before writing them:
+#   inventory: ID and Name as strings, Quantity int32, Expiration Date datetime64 (NaT if none)
+#   sales: Item ID and Item Name categorical, Quantity int32, and the sale's Date and Time
+#     as one datetime64 Timestamp
+# Single rows (a new item, a sale) are passed around as stored, so appending one needs no
+# frame conversion. Dates and times are parsed and formatted once per distinct value.
+import numpy as np
+import pandas as pd
+
+# Columns as stored
+INVENTORY_COLUMNS = ["ID", "Name", "Quantity", "Expiration Date"]
+SALES_COLUMNS = ["Item ID", "Item Name", "Quantity", "Date", "Time"]
+# One row per stock lot; an item's lots add up to its inventory quantity
+LOT_COLUMNS = ["Item ID", "Quantity", "Expiration Date"]
+# Columns of the in-memory sales frame
+SALES_FRAME_COLUMNS = ["Item ID", "Item Name", "Quantity", "Timestamp"]
+
+DATE_FORMAT = "%Y-%m-%d"
+TIME_FORMAT = "%H:%M:%S"
+TIMES_OF_DAY = [f"{h:02d}:{m:02d}:{s:02d}" for h in range(24) for m in range(60) for s in range(60)]
+NAT = np.datetime64("NaT", "s")
+_SECONDS_OF_DAY = {time: second for second, time in enumerate(TIMES_OF_DAY)}
+# Built once: checking 86,400 categories on every write costs more than the write
+_TIME_DTYPE = pd.CategoricalDtype(TIMES_OF_DAY)
+
+
+def parse_dates(values, date_format="mixed"):
+    # Dates as datetime64[s]; blank or invalid ones become NaT
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values.to_numpy().astype("datetime64[s]")
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format=date_format, errors="coerce")
+    return np.append(parsed.to_numpy().astype("datetime64[s]"), NAT)[codes]
+
+
+def format_dates(values):
+    # datetime64 dates as YYYY-MM-DD text, None where there is no date
+    days = parse_dates(values).astype("datetime64[D]")
+    text = np.datetime_as_string(days).astype(object)
+    text[np.isnat(days)] = None
+    return text
+
+
+def months_of(values):
+    # YYYY-MM of each timestamp
+    codes, uniques = pd.factorize(np.asarray(values, dtype="datetime64[s]").astype("datetime64[M]"))
+    return np.append(np.datetime_as_string(uniques).astype(object), None)[codes]
+
+
+def join_timestamps(dates, times):
+    # Date and Time text columns as one datetime64[s] column; a missing time is midnight
+    days = parse_dates(dates, DATE_FORMAT)
+    codes, uniques = pd.factorize(pd.Series(times))
+    of_day = pd.Series([_SECONDS_OF_DAY.get(time) for time in uniques], dtype=float)
+    unknown = of_day.isna()
+    if unknown.any():
+        # Times not written as HH:MM:SS
+        parsed = pd.to_timedelta(pd.Series(uniques, dtype=object)[unknown], errors="coerce")
+        of_day[unknown] = parsed.dt.total_seconds()
+    of_day = np.append(of_day.fillna(0).to_numpy(dtype=np.int64), 0)[codes]
+    return days + of_day.astype("timedelta64[s]")
+
+
+def split_timestamps(values):
+    # datetime64 timestamps as categorical Date and Time text columns, so a whole history
+    # can be written without a string per row
+    seconds = np.asarray(values, dtype="datetime64[s]")
+    missing = np.isnat(seconds)
+    days = seconds.astype("datetime64[D]")
+    codes, uniques = pd.factorize(days)
+    dates = pd.Categorical.from_codes(codes, np.datetime_as_string(uniques))
+    of_day = np.where(missing, -1, (seconds - days).astype(np.int64))
+    times = pd.Categorical.from_codes(of_day, dtype=_TIME_DTYPE)
+    return dates, times
+
+
+def _categorical(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.array
+    codes, uniques = pd.factorize(values)
+    return pd.Categorical.from_codes(codes, uniques)
+
+
+def inventory_frame(data):
+    # The stored inventory columns in the in-memory schema, keeping the row labels
+    return pd.DataFrame({
+        "ID": data["ID"].astype(str).str.strip(),
+        "Name": data["Name"].astype(str),
+        "Quantity": pd.to_numeric(data["Quantity"], errors="coerce").fillna(0).astype(np.int32),
+        "Expiration Date": parse_dates(data["Expiration Date"]),
+    }, index=data.index, columns=INVENTORY_COLUMNS)
+
+
+def inventory_records(data):
+    # The in-memory inventory in the stored columns
+    records = data[INVENTORY_COLUMNS].copy()
+    records["Expiration Date"] = format_dates(records["Expiration Date"])
+    return records
+
+
+def sales_frame(data):
+    # Stored sales columns, or a frame already in the schema, in the in-memory schema
+    if "Timestamp" in data.columns:
+        timestamps = np.asarray(data["Timestamp"], dtype="datetime64[s]")
+    else:
+        timestamps = join_timestamps(data["Date"], data["Time"])
+    return pd.DataFrame({
+        "Item ID": _categorical(data["Item ID"]),
+        "Item Name": _categorical(data["Item Name"]),
+        "Quantity": pd.to_numeric(data["Quantity"]).to_numpy(dtype=np.int32),
+        "Timestamp": timestamps,
+    }, columns=SALES_FRAME_COLUMNS)
+
+
+def sales_records(sales_data):
+    # The in-memory sales in the stored columns
+    dates, times = split_timestamps(sales_data["Timestamp"])
+    return pd.DataFrame({
+        "Item ID": sales_data["Item ID"].array,
+        "Item Name": sales_data["Item Name"].array,
+        "Quantity": sales_data["Quantity"].array,
+        "Date": dates,
+        "Time": times,
+    }, columns=SALES_COLUMNS)
@@ -0,0 +1,446 @@
+# Multi-terminal service: one process owns Inventory and Sales and serves the tills over
+# localhost, so every stock change goes through a single copy of the data instead of each
+# terminal overwriting the files with its own.
+#
+# Protocol: one JSON request per line, {"op": ..., "args": {...}}, answered by one JSON line
+# {"ok": bool, "message": str, "result": ...}. A JSON list of requests is a batch: it runs
+# without other terminals' requests in between and is answered with a list.
+#
+# Items carry versions (see Inventory.bump_versions). edit_item, delete_item and sell accept
+# the versions a terminal last saw and refuse the change if the item has moved on since.
+# Terminals keep a read replica of the inventory and recent sales, kept current with the
+# "changes" request, so lists and searches never wait for the service.
+#
+# Run the service with `python service.py`, then set USE_SERVICE = True in models.py on the tills.
+import asyncio
+import json
+import os
+import socket
+import threading
+import uuid
+
+import pandas as pd
+
+from models import (Inventory, Sales, create_storage, EXPIRY_WARNING_DAYS, IMPORT_REJECTION_COLUMNS,
+                    SERVICE_HOST, SERVICE_PORT, WRITE_BEHIND)
+from schema import (INVENTORY_COLUMNS, LOT_COLUMNS, SALES_COLUMNS, format_dates, inventory_frame, sales_frame,
+                    sales_records)
+
+
+def _item_records(data, versions):
+    # [ID, name, quantity, expiration date, version] per row, as plain JSON values
+    item_ids = data['ID'].tolist()
+    return [[item_id, name, int(quantity), expiration_date, versions.get(item_id, 0)]
+            for item_id, name, quantity, expiration_date in zip(
+                item_ids, data['Name'].tolist(), data['Quantity'].tolist(),
+                format_dates(data['Expiration Date']).tolist())]
+
+
+def _sales_records(sales_data):
+    # Rows as stored, with the date and time as text
+    records = sales_records(sales_data)
+    return [list(row) for row in zip(
+        records['Item ID'].tolist(), records['Item Name'].tolist(), records['Quantity'].astype(int).tolist(),
+        records['Date'].tolist(), records['Time'].tolist())]
+
+
+class PharmacyService:
+    def __init__(self, inventory, sales):
+        self.inventory = inventory
+        self.sales = sales
+        # Versions start again from 0 when the service restarts; terminals notice the new
+        # session and reload instead of asking for changes since a version that means nothing
+        self.session = uuid.uuid4().hex
+
+    def handle(self, request):
+        try:
+            handler = getattr(self, "op_" + request["op"], None)
+            if handler is None:
+                return {"ok": False, "message": f"Unknown request: {request['op']}", "result": None}
+            success, message, result = handler(**request.get("args", {}))
+        except (KeyError, TypeError, ValueError) as e:
+            return {"ok": False, "message": f"Bad request: {e}", "result": None}
+        return {"ok": success, "message": message, "result": result}
+
+    def item(self, item_id):
+        item = self.inventory.get_item(item_id)
+        if item is None:
+            return None
+        return _item_records(item.to_frame().T, self.inventory.versions)[0]
+
+    def op_inventory(self):
+        return True, "", {
+            "session": self.session,
+            "version": self.inventory.version,
+            "rows": _item_records(self.inventory.get_inventory(), self.inventory.versions),
+            "lots": self.inventory.lots.rows(),
+        }
+
+    def op_get_item(self, item_id):
+        item = self.item(item_id)
+        return item is not None, "" if item is not None else "Item not found.", item
+
+    def op_search(self, term, limit=None):
+        return True, "", _item_records(self.inventory.search_inventory(term, limit), self.inventory.versions)
+
+    def op_add_item(self, item_id, name, quantity, expiration_date):
+        success, message = self.inventory.add_item(item_id, name, quantity, expiration_date)
+        return success, message, self.item(item_id)
+
+    def op_edit_item(self, item_id, quantity=None, expiration_date=None, version=None):
+        success, message = self.inventory.edit_item(item_id, quantity, expiration_date, version)
+        return success, message, self.item(item_id)
+
+    def op_delete_item(self, item_id, version=None):
+        success, message = self.inventory.delete_item(item_id, version)
+        return success, message, None
+
+    def op_receive_lot(self, item_id, quantity, expiration_date):
+        success, message = self.inventory.receive_lot(item_id, quantity, expiration_date)
+        return success, message, self.item(item_id)
+
+    def op_expiring_lots(self, days=EXPIRY_WARNING_DAYS):
+        return True, "", self.inventory.expiring_lots(days).values.tolist()
+
+    def op_import_delivery(self, path):
+        # The service reads the file itself; tills share the machine with it
+        success, message, rejections = self.inventory.import_delivery(path)
+        return success, message, [[int(line), str(item_id), reason] for line, item_id, reason in
+                                  rejections[IMPORT_REJECTION_COLUMNS].itertuples(index=False)]
+
+    def op_sell(self, lines, versions=None):
+        success, message = self.sales.record_sales_batch(self.inventory, lines, versions)
+        return success, message, None
+
+    def op_expiry(self, days=EXPIRY_WARNING_DAYS):
+        return True, "", _item_records(self.inventory.check_expirations(days), self.inventory.versions)
+
+    def op_sales(self):
+        return True, "", {"rows": _sales_records(self.sales.sales_data), "size": len(self.sales.sales_data)}
+
+    def op_sales_months(self):
+        return True, "", self.sales.months()
+
+    def op_sales_month(self, month):
+        return True, "", _sales_records(self.sales.storage.load_sales_partition(month))
+
+    def op_changes(self, session, version, sales_size):
+        # Everything a terminal's replica is missing: items changed after `version` (None
+        # for deleted ones) with their lots, and sales recorded after the first `sales_size` rows
+        if session != self.session:
+            return False, "The service was restarted.", None
+        items = []
+        deleted = []
+        for item_id in self.inventory.changed_since(version):
+            item = self.item(item_id)
+            if item is None:
+                deleted.append(item_id)
+            else:
+                items.append(item)
+        sales_data = self.sales.sales_data
+        return True, "", {
+            "version": self.inventory.version,
+            "items": items,
+            "lots": self.inventory.lots.records(item[0] for item in items),
+            "deleted": deleted,
+            "sales": _sales_records(sales_data.iloc[sales_size:]),
+            "sales_size": len(sales_data),
+        }
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {"ok": False, "message": "Bad request: not JSON", "result": None}
+                else:
+                    # Requests run one at a time on the event loop, so a batch is never
+                    # interleaved with another terminal's requests
+                    if isinstance(request, list):
+                        response = [self.handle(item) for item in request]
+                    else:
+                        response = self.handle(request)
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        server = await asyncio.start_server(self.serve_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+class ServiceClient:
+    def __init__(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        self.address = (host, port)
+        self._lock = threading.Lock()
+        self._socket = None
+        self._file = None
+
+    def _connect(self):
+        self._socket = socket.create_connection(self.address)
+        self._file = self._socket.makefile("rwb")
+
+    def _send(self, request):
+        with self._lock:
+            if self._file is None:
+                self._connect()
+            try:
+                self._file.write((json.dumps(request) + "\n").encode())
+                self._file.flush()
+                line = self._file.readline()
+            except OSError:
+                self.close()
+                raise
+            if not line:
+                self.close()
+                raise ConnectionError("The service closed the connection.")
+            return json.loads(line)
+
+    def call(self, op, **args):
+        # Returns the response dict; raises OSError if the service can't be reached
+        return self._send({"op": op, "args": args})
+
+    def batch(self, requests):
+        # requests is a list of (op, args) pairs, sent and answered in one round trip
+        return self._send([{"op": op, "args": args} for op, args in requests])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._socket.close()
+            self._file = None
+            self._socket = None
+
+
+class RemoteStorage:
+    # Storage interface for a terminal: loads come from the service, and writes are no-ops
+    # because the service has already stored the change when the replica applies it
+    def __init__(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        self.client = ServiceClient(host, port)
+        self.inventory = None
+        self.sales = None
+        self.session = None
+
+    def load_inventory(self):
+        result = self.client.call("inventory")["result"]
+        self.session = result["session"]
+        self.loaded_version = result["version"]
+        self.loaded_versions = {row[0]: row[4] for row in result["rows"] if row[4]}
+        self.loaded_lots = result["lots"]
+        return inventory_frame(pd.DataFrame([row[:4] for row in result["rows"]], columns=INVENTORY_COLUMNS))
+
+    def load_sales(self):
+        result = self.client.call("sales")["result"]
+        self.loaded_sales_size = result["size"]
+        return sales_frame(pd.DataFrame(result["rows"], columns=SALES_COLUMNS))
+
+    def sales_months(self):
+        return self.client.call("sales_months")["result"]
+
+    def load_sales_partition(self, month):
+        return sales_frame(pd.DataFrame(self.client.call("sales_month", month=month)["result"], columns=SALES_COLUMNS))
+
+    def insert_item(self, row, data):
+        pass
+
+    def update_item(self, item_id, changes, data):
+        pass
+
+    def delete_item(self, item_id, data):
+        pass
+
+    def save_inventory(self, data):
+        pass
+
+    def import_items(self, top_ups, rows, data):
+        pass
+
+    def load_lots(self):
+        return pd.DataFrame(self.loaded_lots, columns=LOT_COLUMNS)
+
+    def update_lots(self, lots):
+        pass
+
+    def append_sales(self, rows, sales_data):
+        pass
+
+    def save_sales(self, sales_data):
+        pass
+
+    def compact_sales(self, sales_data):
+        pass
+
+    def record_sales_batch(self, updates, rows, inventory_data, sales_data, lots):
+        pass
+
+    def checkpoint_sales(self, sales_data):
+        pass
+
+    def poll_inventory(self):
+        # Other terminals' changes arrive through sync() instead
+        return None
+
+    def poll_sales(self):
+        return None, False
+
+    def _changes_request(self):
+        return "changes", {"session": self.session, "version": self.inventory.version,
+                           "sales_size": self.sales.server_size}
+
+    def sync(self):
+        # Pulls changes made on any terminal into the replicas. Returns True if the service
+        # was restarted and both replicas had to be reloaded; views must then be rebuilt.
+        op, args = self._changes_request()
+        return self._apply_changes(self.client.call(op, **args))
+
+    def request(self, op, **args):
+        # Sends a change and the sync after it as one batch, so the replicas show the
+        # result as soon as the response is back. Returns the change's response.
+        response, changes = self.client.batch([(op, args), self._changes_request()])
+        self._apply_changes(changes)
+        return response
+
+    def _apply_changes(self, response):
+        if not response["ok"]:
+            self.inventory.load_inventory()
+            self.sales.load_sales()
+            return True
+        result = response["result"]
+        self.inventory.apply_remote(result["items"], result["deleted"], result["version"], result["lots"])
+        self.sales.apply_remote(result["sales"], result["sales_size"])
+        return False
+
+    def close(self):
+        self.client.close()
+
+
+class RemoteInventory(Inventory):
+    # Inventory replica: reads are served locally, changes go to the service and come back
+    # through sync(), so the replica only ever holds what the service has stored
+    def __init__(self, storage):
+        super().__init__(storage)
+        storage.inventory = self
+
+    def load_inventory(self):
+        super().load_inventory()
+        self.version = self.storage.loaded_version
+        self.versions = dict(self.storage.loaded_versions)
+
+    def apply_remote(self, items, deleted, version, lots=None):
+        for item_id in deleted:
+            if self.has_item(item_id):
+                Inventory.delete_item(self, item_id)
+        for item_id, name, quantity, expiration_date, item_version in items:
+            item = self.get_item(item_id)
+            if item is not None and item['Name'] != name:
+                # Deleted and added again under the same ID
+                Inventory.delete_item(self, item_id)
+                item = None
+            if item is None:
+                Inventory.add_item(self, item_id, name, quantity, expiration_date)
+            else:
+                Inventory.edit_item(self, item_id, quantity, expiration_date)
+            if lots and item_id in lots:
+                self.lots.replace(item_id, lots[item_id])
+            self.versions[item_id] = item_version
+        self.version = version
+
+    def _request(self, op, **args):
+        try:
+            response = self.storage.request(op, **args)
+        except OSError as e:
+            return False, f"Service unavailable: {e}"
+        return response["ok"], response["message"]
+
+    def add_item(self, item_id, name, quantity, expiration_date):
+        return self._request("add_item", item_id=str(item_id).strip(), name=name, quantity=int(quantity),
+                             expiration_date=expiration_date)
+
+    def edit_item(self, item_id, quantity=None, expiration_date=None, version=None):
+        if version is None:
+            version = self.get_version(item_id)
+        return self._request("edit_item", item_id=str(item_id).strip(), quantity=quantity,
+                             expiration_date=expiration_date, version=version)
+
+    def delete_item(self, item_id, version=None):
+        if version is None:
+            version = self.get_version(item_id)
+        return self._request("delete_item", item_id=str(item_id).strip(), version=version)
+
+    def receive_lot(self, item_id, quantity, expiration_date):
+        return self._request("receive_lot", item_id=str(item_id).strip(), quantity=int(quantity),
+                             expiration_date=expiration_date)
+
+    def import_delivery(self, path):
+        try:
+            response = self.storage.request("import_delivery", path=os.path.abspath(path))
+        except OSError as e:
+            return False, f"Service unavailable: {e}", pd.DataFrame(columns=IMPORT_REJECTION_COLUMNS)
+        return (response["ok"], response["message"],
+                pd.DataFrame(response["result"] or [], columns=IMPORT_REJECTION_COLUMNS))
+
+
+class RemoteSales(Sales):
+    # Sales replica holding the service's current sales; older months are paged in from it
+    def __init__(self, storage):
+        super().__init__(storage)
+        storage.sales = self
+
+    def load_sales(self):
+        super().load_sales()
+        # Rows of the service's sales buffer already in the replica
+        self.server_size = self.storage.loaded_sales_size
+
+    def apply_remote(self, rows, server_size):
+        if rows:
+            first_row = self._size
+            self._append_rows(rows)
+            self.notify(inserted=range(first_row, self._size))
+        self.server_size = server_size
+
+    def record_sale(self, item_id, item_name, quantity):
+        return self.record_sales_batch(self.storage.inventory, [(item_id, quantity)])
+
+    def record_sales_batch(self, inventory, lines, versions=None):
+        # Stock is checked by the service against its own counts, so concurrent sales of
+        # the same item can't oversell it; versions are only sent when asked for
+        lines = [[str(item_id).strip(), int(quantity)] for item_id, quantity in lines]
+        try:
+            response = self.storage.request("sell", lines=lines, versions=versions)
+        except OSError as e:
+            return False, f"Service unavailable: {e}"
+        return response["ok"], response["message"]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the pharmacy inventory and sales to several terminals.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    args = parser.parse_args()
+
+    storage = create_storage(write_behind=WRITE_BEHIND)
+    inventory = Inventory(storage)
+    sales = Sales(storage)
+    service = PharmacyService(inventory, sales)
+    print(f"Serving {len(inventory.data)} items on {args.host}:{args.port}")
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sales.checkpoint()
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Fast start-up: the login window comes up before pandas and the models are imported, and
+# the inventory and sales are loaded on a background thread while the user logs in.
+#
+#   python startup.py
+#
+# Only tkinter is imported up front and the theme is applied once the first frame is on
+# screen. The preload thread imports main and builds the models PharmacyApp would otherwise
+# load after login. Time to the first frame and to a usable app are recorded as
+# Startup.first_frame and Startup.usable in the timing stats.
+import threading
+import time
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk, messagebox
+
+from users import UserManager
+
+STARTED = time.perf_counter()
+# How often the login screen checks whether the preload has finished
+PRELOAD_POLL_MS = 50
+
+
+def configure_root(root):
+    root.title("Pharmacy Management System")
+
+    # Set minimum and maximum window sizes
+    root.minsize(800, 600)
+    root.maxsize(1200, 800)
+
+    # Set custom fonts
+    default_font = tkfont.nametofont("TkDefaultFont")
+    default_font.configure(size=10)
+    root.option_add("*Font", default_font)
+
+    # Set color scheme
+    root.configure(background='#f0f0f0')
+
+
+def configure_styles():
+    # Custom styles; set after the theme, which would reset them
+    style = ttk.Style()
+    style.configure("Accent.TButton", foreground="white", background="#007bff")
+
+
+def create_login(root, on_login):
+    # The login form; on_login(login_frame, username, password) is called on Login
+    login_frame = ttk.Frame(root, padding="20 20 20 20")
+    login_frame.pack(fill=tk.BOTH, expand=True)
+
+    ttk.Label(login_frame, text="Username").grid(row=0, column=0, sticky=tk.W, pady=5)
+    username_entry = ttk.Entry(login_frame)
+    username_entry.grid(row=0, column=1, sticky=tk.E, pady=5)
+
+    ttk.Label(login_frame, text="Password").grid(row=1, column=0, sticky=tk.W, pady=5)
+    password_entry = ttk.Entry(login_frame, show="*")
+    password_entry.grid(row=1, column=1, sticky=tk.E, pady=5)
+
+    login_button = ttk.Button(login_frame, text="Login",
+                              command=lambda: on_login(login_frame, username_entry.get(), password_entry.get()))
+    login_button.grid(row=2, column=0, columnspan=2, pady=10)
+    username_entry.focus_set()
+    return login_frame
+
+
+class Preloader:
+    # Imports main and loads the models on a worker thread. Tk is only used from the main
+    # thread, which polls done() and then hands the models to PharmacyApp.
+    def __init__(self):
+        self.main = None
+        self.models = None
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="preload", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            import main
+            self.main = main
+            self.models = main.load_models()
+        except Exception as e:
+            self.error = e
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def close(self):
+        # Closing before login: let the load finish (it may be migrating files) and close
+        # the storage it opened
+        self._thread.join()
+        if self.models is not None:
+            self.models[0].close()
+
+
+def main():
+    root = tk.Tk()
+    configure_root(root)
+    user_manager = UserManager()
+
+    def login(login_frame, username, password):
+        role = user_manager.authenticate(username, password)
+        if not role:
+            messagebox.showerror("Invalid Credentials", "Invalid username or password.")
+            return
+        # Hide the login frame and show the main application once the data is loaded
+        login_frame.pack_forget()
+        loading = ttk.Label(root, text="Loading inventory and sales...", padding="20 20 20 20")
+        loading.pack(fill=tk.BOTH, expand=True)
+        open_app(role, loading)
+
+    def open_app(role, loading):
+        if not preloader.done():
+            root.after(PRELOAD_POLL_MS, open_app, role, loading)
+            return
+        loading.destroy()
+        if preloader.error is not None:
+            messagebox.showerror("Error", f"Could not load the data: {preloader.error}")
+            root.destroy()
+            return
+        preloader.main.PharmacyApp(root, role, preloader.models)
+        from instrumentation import timings
+        timings.record("Startup.first_frame", first_frame)
+        timings.record("Startup.usable", time.perf_counter() - STARTED)
+
+    def close():
+        preloader.close()
+        root.destroy()
+
+    create_login(root, login)
+    root.protocol("WM_DELETE_WINDOW", close)
+    # Draw the login window before anything else is loaded
+    root.update()
+    first_frame = time.perf_counter() - STARTED
+
+    preloader = Preloader()
+    from ttkthemes import ThemedStyle
+    ThemedStyle(root).set_theme("arc")  # Use a modern theme
+    configure_styles()
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
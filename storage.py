@@ -0,0 +1,1336 @@
+# Storage backends for Inventory and Sales.
+#
+# Every backend offers the same methods, so Inventory and Sales don't need to know
+# where their data lives:
+#   load_inventory(), insert_item(), update_item(), delete_item(), save_inventory(),
+#   import_items(), load_lots(), update_lots(),
+#   load_sales(), append_sales(), save_sales(), compact_sales(),
+#   record_sales_batch(), checkpoint_sales(), sales_months(), load_sales_partition(),
+#   poll_inventory(), poll_sales(), close()
+# Mutating methods also receive the in-memory frame after the change, so backends that
+# can't write a single row (plain CSV files) can persist the whole table instead.
+# Loaded frames are converted to the typed schema in schema.py, and whole frames are
+# converted back to the stored columns when written; single rows are passed as stored.
+import csv
+import io
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import log, timed, timings
+from schema import (INVENTORY_COLUMNS, LOT_COLUMNS, SALES_COLUMNS, SALES_FRAME_COLUMNS, inventory_frame,
+                    inventory_records, months_of, sales_frame, sales_records)
+
+DURABILITY_POLICIES = ("none", "flush", "fsync")
+
+
+def write_csv_atomic(data, path):
+    # Write next to the target and rename, so a crash never leaves a half-written file
+    temp_file = path + ".tmp"
+    data.to_csv(temp_file, index=False)
+    os.replace(temp_file, path)
+
+
+# Sales snapshot: one .npy file per column of the in-memory frame, read in full on load.
+# That is fast (no parsing), but not memory-mapped: Sales copies the columns into its
+# growable, nullable buffer straight away. Text columns are stored as int32 category codes
+# plus a categories file, quantities as int32 and timestamps as int64 seconds.
+SNAPSHOT_CATEGORICAL = ("Item ID", "Item Name")
+
+
+def _file_state(path):
+    # Changes whenever the file is written or replaced (a replacement is a new inode)
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def append_csv_rows(path, rows, durability="flush"):
+    # Appends rows to a CSV file, starting it with the header if it is new or empty
+    with open(path, "a", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        if csv_file.tell() == 0:
+            writer.writerow(SALES_COLUMNS)
+        writer.writerows(rows)
+        csv_file.flush()
+        if durability == "fsync":
+            os.fsync(csv_file.fileno())
+
+
+class FileLock:
+    # Advisory lock shared by every process that uses the same lock file. It only holds off
+    # processes that take it too (other instances of the app), and it is re-entrant within
+    # a process, whose threads are kept apart by an ordinary lock.
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            self._file = open(self.path, "a+")
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            else:
+                self._file.seek(0)
+                while True:
+                    try:
+                        # Gives up after about 10 seconds, so just keep trying
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+def write_sales_snapshot(sales_data, snapshot_dir, sales_file, journal_file):
+    # Must run after every journal append it is meant to cover; the snapshot records how
+    # much of the sales file and journal it contains so loading only parses what follows
+    os.makedirs(snapshot_dir, exist_ok=True)
+    meta = {
+        "rows": len(sales_data),
+        "sales_file": _file_state(sales_file),
+        "journal_offset": os.path.getsize(journal_file) if os.path.exists(journal_file) else 0,
+    }
+    for column in SALES_FRAME_COLUMNS:
+        path = os.path.join(snapshot_dir, f"sales.{column}")
+        if column in SNAPSHOT_CATEGORICAL:
+            values = pd.Categorical(sales_data[column])
+            np.save(path + ".codes.tmp.npy", np.asarray(values.codes, dtype=np.int32))
+            np.save(path + ".categories.tmp.npy", np.asarray(values.categories, dtype=str))
+            os.replace(path + ".codes.tmp.npy", path + ".codes.npy")
+            os.replace(path + ".categories.tmp.npy", path + ".categories.npy")
+        else:
+            if column == "Timestamp":
+                values = sales_data[column].to_numpy(dtype="datetime64[s]").view(np.int64)
+            else:
+                values = sales_data[column].fillna(0).to_numpy(dtype=np.int32)
+            np.save(path + ".tmp.npy", values)
+            os.replace(path + ".tmp.npy", path + ".npy")
+    # The metadata goes last, so a half-written snapshot is never picked up
+    meta_file = os.path.join(snapshot_dir, "sales.json")
+    with open(meta_file + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_file + ".tmp", meta_file)
+
+
+def read_sales_snapshot(snapshot_dir, sales_file, journal_file):
+    # Returns (sales frame, journal offset), or None if there is no usable snapshot
+    meta_file = os.path.join(snapshot_dir, "sales.json")
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file) as f:
+        meta = json.load(f)
+    journal_size = os.path.getsize(journal_file) if os.path.exists(journal_file) else 0
+    if meta["sales_file"] != _file_state(sales_file) or journal_size < meta["journal_offset"]:
+        return None
+
+    # Snapshots from before the typed schema have no Timestamp file and are ignored
+    columns = {}
+    try:
+        for column in SALES_FRAME_COLUMNS:
+            path = os.path.join(snapshot_dir, f"sales.{column}")
+            if column in SNAPSHOT_CATEGORICAL:
+                codes = np.load(path + ".codes.npy")
+                categories = np.load(path + ".categories.npy").astype(object)
+                columns[column] = pd.Categorical.from_codes(codes, categories)
+            elif column == "Timestamp":
+                columns[column] = np.load(path + ".npy").view("datetime64[s]")
+            else:
+                columns[column] = np.load(path + ".npy")
+    except (OSError, ValueError):
+        return None
+    sales_data = pd.DataFrame(columns, columns=SALES_FRAME_COLUMNS)
+    if len(sales_data) != meta["rows"]:
+        return None
+    return sales_data, meta["journal_offset"]
+
+
+# Stock journal: a checkout appends the new stock of each item it sold, as a line
+# ["stock", sequence, item ID, quantity, expiration date] for the inventory file and a line
+# ["lot", sequence, item ID, quantity, expiration date] per lot left for the lots file (one
+# with no quantity if none are left). The files themselves catch up on the background
+# writer. Every write of either file appends a marker ["base", file, size, mtime, inode,
+# sequence] with the _file_state() of the new file and the last record it holds before
+# putting the file in place, then starts the journal again from the files' markers and the
+# records they don't hold. Loading replays, for each file, the records after its last marker
+# that matches the file on disk.
+STOCK_RECORDS = {"inventory": "stock", "lots": "lot"}
+
+
+def _stock_marker(target, state, sequence):
+    return ["base", target] + (state or ["", "", ""]) + [sequence]
+
+
+def _read_stock_rows(journal_file):
+    with open(journal_file, newline="") as f:
+        # Lines cut short by a crash are left out
+        return [row for row in csv.reader(f) if (len(row) == 6 and row[0] == "base" and row[1] in STOCK_RECORDS)
+                or (len(row) == 5 and row[0] in STOCK_RECORDS.values())]
+
+
+def read_stock_journal(journal_file, states):
+    # states: {file: _file_state() of it on disk} for "inventory" and "lots". Returns
+    # ({file: [sequence, item ID, quantity, date] records it doesn't hold yet}, {file: last
+    # sequence it holds}, last sequence)
+    if not os.path.exists(journal_file):
+        return {target: [] for target in states}, {target: 0 for target in states}, 0
+    rows = _read_stock_rows(journal_file)
+    last = max([int(row[5]) for row in rows if row[0] == "base"] + [int(row[1]) for row in rows if row[0] != "base"],
+               default=0)
+    records, held = {}, {}
+    for target, state in states.items():
+        matches = [int(row[5]) for row in rows if row[0] == "base" and row[1] == target
+                   and ([int(value) for value in row[2:5]] if row[2] else None) == state]
+        # With no match the file was replaced by something other than this storage, so it
+        # is taken as it is
+        held[target] = matches[-1] if matches else last
+        records[target] = [row[1:] for row in rows if row[0] == STOCK_RECORDS[target] and int(row[1]) > held[target]]
+    return records, held, last
+
+
+def _apply_stock(stored, records):
+    # Sets the quantity and expiration date of the stored rows from "stock" records
+    stock = {item_id: (int(quantity), date or None) for _, item_id, quantity, date in records}
+    if not stock:
+        return stored
+    positions = pd.Index(stored["ID"].astype(str).str.strip()).get_indexer(list(stock))
+    for (quantity, date), position in zip(stock.values(), positions):
+        if position < 0:
+            # No longer in the file; there is nothing to update
+            continue
+        stored.iat[position, stored.columns.get_loc("Quantity")] = quantity
+        stored.iat[position, stored.columns.get_loc("Expiration Date")] = date
+    return stored
+
+
+def _merge_lots(stored, lots):
+    # The stored lots with those of the items in lots, {item ID: [(quantity, expiration date
+    # or None)]}, replaced
+    if not lots:
+        return stored
+    rows = [[item_id, quantity, date] for item_id, item_lots in lots.items() for quantity, date in item_lots]
+    return pd.concat([stored[~stored["Item ID"].isin(lots.keys())], pd.DataFrame(rows, columns=LOT_COLUMNS)],
+                     ignore_index=True)
+
+
+def _lot_records(sequence, lots):
+    # "lot" lines for {item ID: [(quantity, expiration date or None)]}
+    return [["lot", sequence, item_id, quantity, date or ""] for item_id, item_lots in lots.items()
+            for quantity, date in item_lots] + \
+        [["lot", sequence, item_id, "", ""] for item_id, item_lots in lots.items() if not item_lots]
+
+
+def _replay_lots(records):
+    # {item ID: [(quantity, expiration date or None)]} from "lot" records, the latest per item
+    lots, sequences = {}, {}
+    for sequence, item_id, quantity, date in records:
+        if sequences.get(item_id) != sequence:
+            sequences[item_id] = sequence
+            lots[item_id] = []
+        if quantity:
+            lots[item_id].append((int(quantity), date or None))
+    return lots
+
+
+def concat_sales(head, tail):
+    # Appends sales to a frame, merging the categories of the categorical columns
+    if tail.empty:
+        return head
+    tail = tail.reset_index(drop=True)
+    for column in SALES_FRAME_COLUMNS:
+        if isinstance(head[column].dtype, pd.CategoricalDtype):
+            categories = head[column].cat.categories
+            new = pd.Index(tail[column].dropna().unique()).difference(categories)
+            if len(new):
+                head[column] = head[column].cat.add_categories(new)
+            tail[column] = pd.Categorical(tail[column], categories=head[column].cat.categories)
+    return pd.concat([head, tail], ignore_index=True)
+
+
+def current_month():
+    return datetime.now().strftime("%Y-%m")
+
+
+class SalesPartitions:
+    # Sales history split by month: one YYYY-MM.csv file per month, and manifest.json with
+    # the rows and first/last sale date of each, so the months can be listed without
+    # reading them. Month files are append-only, like the journal.
+    def __init__(self, directory, durability="flush"):
+        self.directory = directory
+        self.durability = durability
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_file = os.path.join(directory, "manifest.json")
+        self.manifest = {}
+        self._manifest_state = None
+        self.refresh()
+        # A crash between writing a month file and the manifest leaves the file unlisted
+        for name in sorted(os.listdir(directory)):
+            month = name[:-4]
+            if name.endswith(".csv") and month not in self.manifest:
+                self._describe(month, self.load(month))
+                self._write_manifest()
+
+    def refresh(self):
+        # Re-reads the manifest if another process has written it since
+        state = _file_state(self.manifest_file)
+        if state is not None and state != self._manifest_state:
+            with open(self.manifest_file) as f:
+                self.manifest = json.load(f)
+            self._manifest_state = state
+
+    def path(self, month):
+        return os.path.join(self.directory, f"{month}.csv")
+
+    def months(self):
+        return sorted(self.manifest)
+
+    def load(self, month):
+        path = self.path(month)
+        if os.path.exists(path) and os.path.getsize(path):
+            return pd.read_csv(path, dtype={"Item ID": str})
+        return pd.DataFrame(columns=SALES_COLUMNS)
+
+    def _describe(self, month, data):
+        if data.empty:
+            self.manifest.pop(month, None)
+            return
+        dates = data["Date"].astype(str)
+        self.manifest[month] = {"rows": len(data), "first": dates.min(), "last": dates.max()}
+
+    def _write_manifest(self):
+        with open(self.manifest_file + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(self.manifest_file + ".tmp", self.manifest_file)
+        self._manifest_state = _file_state(self.manifest_file)
+
+    def append(self, rows):
+        # Appends sale rows to their months' files. Returns what truncate() needs to undo it.
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(str(row[3])[:7], []).append(row)
+        self.refresh()
+        undo = {}
+        for month, month_rows in by_month.items():
+            path = self.path(month)
+            offset = os.path.getsize(path) if os.path.exists(path) else 0
+            undo[month] = (offset, self.manifest.get(month))
+            append_csv_rows(path, month_rows, self.durability)
+            dates = [str(row[3]) for row in month_rows]
+            entry = dict(self.manifest.get(month) or {"rows": 0, "first": min(dates), "last": max(dates)})
+            entry["rows"] += len(month_rows)
+            entry["first"] = min(entry["first"], min(dates))
+            entry["last"] = max(entry["last"], max(dates))
+            self.manifest[month] = entry
+        self._write_manifest()
+        return undo
+
+    def truncate(self, undo):
+        self.refresh()
+        for month, (offset, entry) in undo.items():
+            if offset:
+                with open(self.path(month), "r+") as month_file:
+                    month_file.truncate(offset)
+                self.manifest[month] = entry
+            else:
+                os.remove(self.path(month))
+                self.manifest.pop(month, None)
+        self._write_manifest()
+
+    def write(self, month, data):
+        # Replaces a whole month
+        self.refresh()
+        if data.empty:
+            if os.path.exists(self.path(month)):
+                os.remove(self.path(month))
+        else:
+            write_csv_atomic(data, self.path(month))
+        self._describe(month, data)
+        self._write_manifest()
+
+
+def partition_sales(partition_dir, sales_file, journal_file, chunk_rows=100000):
+    # Splits sales.csv and the journal into monthly partitions, a chunk at a time so the
+    # whole history is never in memory
+    partitions = SalesPartitions(partition_dir, durability="none")
+    rows = 0
+    for path in (sales_file, journal_file):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            continue
+        for chunk in pd.read_csv(path, dtype={"Item ID": str}, chunksize=chunk_rows):
+            chunk["Item ID"] = chunk["Item ID"].astype(str).str.strip()
+            partitions.append(chunk[SALES_COLUMNS].itertuples(index=False, name=None))
+            rows += len(chunk)
+    return len(partitions.months()), rows
+
+
+class PersistenceWorker:
+    # Runs storage writes on a background thread so saving never blocks the UI. Jobs
+    # submitted under a key that is still waiting in the queue are coalesced: the queued
+    # run executes the newest job. Jobs with key=None always run, in submission order.
+    # Each job is timed as "PersistenceWorker.write[name]", the name defaulting to its key.
+    def __init__(self, max_pending=64):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = None  # Token of the job being written
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, job, name=None):
+        name = name or key or "job"
+        with self._lock:
+            if key is not None and key in self._jobs:
+                self._jobs[key] = (job, name)
+                return
+            token = key if key is not None else object()
+            self._jobs[token] = (job, name)
+            self._pending += 1
+        # Blocks while the queue is full, which keeps memory for snapshots bounded
+        self._queue.put(token)
+
+    def pending(self):
+        return self._pending
+
+    def pending_besides(self, keys):
+        # True if any job other than those submitted under `keys` is waiting or running
+        with self._lock:
+            return any(token not in keys for token in self._jobs) or \
+                (self._running is not None and self._running not in keys)
+
+    def _run(self):
+        while True:
+            token = self._queue.get()
+            if token is None:
+                self._queue.task_done()
+                return
+            with self._lock:
+                job, name = self._jobs.pop(token)
+                self._running = token
+            started = time.perf_counter()
+            try:
+                job()
+            except Exception as e:
+                # Kept until shutdown so the UI can keep showing that data isn't saved
+                self.error = e
+                log.exception("Error saving data")
+            finally:
+                timings.record(f"PersistenceWorker.write[{name}]", time.perf_counter() - started)
+                with self._lock:
+                    self._pending -= 1
+                    self._running = None
+                self._queue.task_done()
+
+    def flush(self):
+        # Wait until everything submitted so far is written
+        self._queue.join()
+
+    def shutdown(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+
+class CsvStorage:
+    def __init__(self, inventory_file, sales_file, journal_file, journal=True, durability="flush", writer=None,
+                 snapshot_dir=None, partition_dir=None, shared=False, lots_file=None, stock_journal_file=None):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"Unknown durability policy: {durability}")
+        self.inventory_file = inventory_file
+        self.sales_file = sales_file
+        self.journal_file = journal_file
+        self.journal = journal
+        self.durability = durability
+        # With a PersistenceWorker, writes happen in the background. Whole-table writes
+        # then use the newest snapshot at the time they run, so coalesced and reordered
+        # writes still end with the latest state on disk.
+        self.writer = writer
+        # With a snapshot directory, sales load from the last checkpoint plus the journal tail
+        self.snapshot_dir = snapshot_dir
+        # With a partition directory, sales are kept in monthly files instead of sales_file
+        # and the journal, and only the current month is loaded at start-up
+        self.partitions = SalesPartitions(partition_dir, durability) if partition_dir else None
+        # Shared mode: several app instances use the same files. Every write holds an
+        # advisory lock, inventory changes are merged into the file as it is on disk rather
+        # than overwriting it, and poll_inventory()/poll_sales() pick up what the other
+        # instances wrote, using file stats and byte offsets.
+        self.shared = shared
+        self.lock = FileLock(inventory_file + ".lock") if shared else nullcontext()
+        self._inventory_state = None  # _file_state() of the inventory file as last loaded
+        self._sales_state = None
+        self._tails = {}  # sales file -> bytes of it already loaded
+        self._own = {}  # sales file -> [(start, end)] byte ranges appended by this process
+        # Stock lots, if kept (see load_lots()). Changed items' lots wait in _pending_lots
+        # until the next write merges them into the lots as last loaded or written, which
+        # are kept in _stored_lots (shared mode merges into the file as it is on disk).
+        self.lots_file = lots_file
+        self._pending_lots = {}
+        self._lots_sequence = 0  # Last stock record the pending lots hold
+        self._stored_lots = None
+        self._lots_lock = threading.Lock()
+        # With a stock journal, a checkout appends the new stock of the items sold there and
+        # leaves the inventory file to the background writer (see read_stock_journal()).
+        # Shared mode merges checkouts into the file instead, so it has none.
+        self.stock_journal_file = None if shared else stock_journal_file
+        self._stock_lock = threading.Lock()
+        self._stock_sequence = 0  # Last stock record appended
+        self._stock_held = {}  # "inventory"/"lots" -> last stock record held by the file on disk
+        # (frame, last stock record it holds) for the next inventory write
+        self._inventory_snapshot = None
+        self._sales_snapshot = None
+        self._journal = None
+        self._journal_writer = None
+
+    def _submit(self, key, job, name=None):
+        def locked_job():
+            with self.lock:
+                job()
+
+        if self.writer is None:
+            locked_job()
+        else:
+            self.writer.submit(key, locked_job, name)
+
+    def _snapshot(self, data):
+        # The in-memory frames keep changing, so background writes get their own copy
+        return data if self.writer is None else data.copy()
+
+    def load_inventory(self):
+        with self.lock:
+            self._inventory_state = _file_state(self.inventory_file)
+            if os.path.exists(self.inventory_file):
+                stored = pd.read_csv(self.inventory_file, dtype={"ID": str})
+            else:
+                stored = pd.DataFrame(columns=INVENTORY_COLUMNS)
+            if self.stock_journal_file:
+                # Checkouts the file doesn't hold yet
+                with self._stock_lock:
+                    stored = _apply_stock(stored, self._read_stock()["inventory"])
+        return inventory_frame(stored)
+
+    def poll_inventory(self):
+        # The inventory as it is now on disk if another process changed the file, else None
+        if self.writer is not None:
+            # Our own queued changes go first, so the file isn't mistaken for newer
+            self.writer.flush()
+        with self.lock:
+            if _file_state(self.inventory_file) == self._inventory_state:
+                return None
+            return self.load_inventory()
+
+    def save_inventory(self, data):
+        self._inventory_snapshot = (self._snapshot(data), self._stock_sequence)
+        self._submit("inventory", self._write_inventory)
+
+    @timed
+    def _write_inventory(self):
+        data, sequence = self._inventory_snapshot
+        self._replace_inventory(inventory_records(data), sequence)
+
+    def _replace_inventory(self, data, sequence=None):
+        # If nobody else wrote the file since it was loaded, the new file is what we hold
+        # in memory; otherwise its state is left stale so poll_inventory() reloads it.
+        # sequence: the last stock record the data holds, if it comes from memory.
+        unchanged = _file_state(self.inventory_file) == self._inventory_state
+        self._write_stock_file("inventory", data, sequence)
+        if unchanged:
+            self._inventory_state = _file_state(self.inventory_file)
+
+    def _stock_files(self):
+        # The files the stock journal keeps records for
+        files = {"inventory": self.inventory_file}
+        if self.lots_file:
+            files["lots"] = self.lots_file
+        return files
+
+    def _read_stock(self):
+        # Records the files on disk don't hold yet, per file. Callers hold _stock_lock.
+        records, self._stock_held, last = read_stock_journal(
+            self.stock_journal_file, {target: _file_state(path) for target, path in self._stock_files().items()})
+        self._stock_sequence = max(self._stock_sequence, last)
+        return records
+
+    def _write_stock_file(self, target, data, sequence):
+        # Writes the inventory or lots file; sequence is the last stock record data holds
+        path = self._stock_files()[target]
+        if not self.stock_journal_file or sequence is None or not os.path.exists(self.stock_journal_file):
+            write_csv_atomic(data, path)
+            if sequence is not None:
+                self._stock_held[target] = sequence
+            return
+        temp_file = path + ".tmp"
+        data.to_csv(temp_file, index=False)
+        # Marked before the file goes in, so that after a crash in between the journal
+        # still says which records the new file holds
+        with self._stock_lock:
+            with open(self.stock_journal_file, "a", newline="") as journal_file:
+                csv.writer(journal_file).writerow(_stock_marker(target, _file_state(temp_file), sequence))
+        os.replace(temp_file, path)
+        self._rebase_stock(target, sequence)
+
+    def _rebase_stock(self, target, sequence):
+        # Starts the stock journal again from the files as they are on disk, where `target`
+        # now holds the records up to `sequence`; the records a file doesn't hold are kept
+        with self._stock_lock:
+            self._stock_held[target] = sequence
+            targets = {kind: target for target, kind in STOCK_RECORDS.items()}
+            later = [row for row in _read_stock_rows(self.stock_journal_file)
+                     if row[0] != "base" and int(row[1]) > self._stock_held.get(targets[row[0]], 0)]
+            temp_file = self.stock_journal_file + ".tmp"
+            with open(temp_file, "w", newline="") as journal_file:
+                writer = csv.writer(journal_file)
+                writer.writerows(_stock_marker(target, _file_state(path), self._stock_held.get(target, 0))
+                                 for target, path in self._stock_files().items())
+                writer.writerows(later)
+            os.replace(temp_file, self.stock_journal_file)
+
+    @timed
+    def _append_stock(self, updates, lots):
+        # One checkout's records: updates are (item ID, quantity, expiration date or None)
+        # per item sold, lots {item ID: [(quantity, expiration date or None)]} left of them
+        with self._stock_lock:
+            new = not os.path.exists(self.stock_journal_file)
+            offset = 0 if new else os.path.getsize(self.stock_journal_file)
+            sequence = self._stock_sequence + 1
+            try:
+                with open(self.stock_journal_file, "a", newline="") as journal_file:
+                    writer = csv.writer(journal_file)
+                    if new:
+                        writer.writerows(_stock_marker(target, _file_state(path), self._stock_held.get(target, 0))
+                                         for target, path in self._stock_files().items())
+                    writer.writerows(["stock", sequence, item_id, quantity, date or ""]
+                                     for item_id, quantity, date in updates)
+                    if self.lots_file:
+                        writer.writerows(_lot_records(sequence, lots))
+                    if self.durability == "fsync":
+                        journal_file.flush()
+                        os.fsync(journal_file.fileno())
+            except Exception:
+                if os.path.exists(self.stock_journal_file):
+                    with open(self.stock_journal_file, "r+") as journal_file:
+                        journal_file.truncate(offset)
+                raise
+            self._stock_sequence = sequence
+
+    @timed
+    def _merge_inventory(self, change):
+        # Shared mode: applies change(stored frame) -> frame to the file as it is on disk,
+        # keeping whatever other instances changed since this one loaded it
+        if os.path.exists(self.inventory_file) and os.path.getsize(self.inventory_file):
+            stored = pd.read_csv(self.inventory_file, dtype={"ID": str})
+        else:
+            stored = pd.DataFrame(columns=INVENTORY_COLUMNS)
+        stored["ID"] = stored["ID"].astype(str).str.strip()
+        self._replace_inventory(change(stored))
+
+    def insert_item(self, row, data):
+        if self.shared:
+            row = list(row)
+            self._submit(None, lambda: self._merge_inventory(lambda stored: pd.concat(
+                [stored[stored["ID"] != row[0]], pd.DataFrame([row], columns=INVENTORY_COLUMNS)], ignore_index=True)),
+                name="insert_item")
+            return
+        # A new item only adds a line, so append it instead of rewriting the file. In the
+        # background a queued full write may already include the row, so coalesce into that.
+        if self.writer is not None or not os.path.exists(self.inventory_file) or os.path.getsize(self.inventory_file) == 0:
+            self.save_inventory(data)
+            return
+        with open(self.inventory_file, "a", newline="") as inventory_file:
+            csv.writer(inventory_file).writerow(row)
+        if self.stock_journal_file and os.path.exists(self.stock_journal_file):
+            # The file changed under the journal's marker
+            self._rebase_stock("inventory", self._stock_held.get("inventory", 0))
+
+    def update_item(self, item_id, changes, data):
+        if self.shared:
+            changes = dict(changes)
+            self._submit(None, lambda: self._merge_inventory(lambda stored: _set_item(stored, item_id, changes)),
+                         name="update_item")
+            return
+        self.save_inventory(data)
+
+    def delete_item(self, item_id, data):
+        if self.shared:
+            self._submit(None, lambda: self._merge_inventory(lambda stored: stored[stored["ID"] != item_id]),
+                         name="delete_item")
+            return
+        self.save_inventory(data)
+
+    def load_lots(self):
+        # Only items whose stock was changed since the file was started have lots here; the
+        # rest are one lot as described by their inventory row
+        with self.lock:
+            if self.lots_file and os.path.exists(self.lots_file) and os.path.getsize(self.lots_file):
+                stored = pd.read_csv(self.lots_file, dtype={"Item ID": str})
+            else:
+                stored = pd.DataFrame(columns=LOT_COLUMNS)
+            stored["Item ID"] = stored["Item ID"].astype(str).str.strip()
+            if self.lots_file and self.stock_journal_file:
+                # Checkouts the file doesn't hold yet
+                with self._stock_lock:
+                    stored = _merge_lots(stored, _replay_lots(self._read_stock()["lots"]))
+                with self._lots_lock:
+                    self._stored_lots = stored
+                    self._lots_sequence = max(self._lots_sequence, self._stock_sequence)
+        return stored.copy()
+
+    def update_lots(self, lots):
+        # lots: {item ID: [(quantity, expiration date or None)]} for the items that changed,
+        # an empty list for items that have none left
+        if not self.lots_file:
+            return
+        with self._lots_lock:
+            self._pending_lots.update(lots)
+            self._lots_sequence = self._stock_sequence
+        self._submit("lots", self._write_lots)
+
+    @timed
+    def _write_lots(self):
+        # One write for every change queued so far
+        with self._lots_lock:
+            lots, self._pending_lots = self._pending_lots, {}
+            sequence = self._lots_sequence
+            stored = self._stored_lots
+        if not lots:
+            return
+        if self.shared or stored is None:
+            # Merged into the file as it is on disk, so that other instances' lots are kept
+            stored = self.load_lots()
+        stored = _merge_lots(stored, lots)
+        self._write_stock_file("lots", stored, sequence if self.stock_journal_file else None)
+        if not self.shared:
+            with self._lots_lock:
+                self._stored_lots = stored
+
+    def import_items(self, top_ups, rows, data):
+        # A bulk delivery: top_ups are (item ID, quantity added, expiration date or None)
+        # for existing items, rows are the new items
+        if self.shared:
+            top_ups, rows = list(top_ups), list(rows)
+            self._submit(None, lambda: self._merge_inventory(lambda stored: _receive_items(stored, top_ups, rows)),
+                         name="import_items")
+            return
+        self.save_inventory(data)
+
+    def load_sales(self):
+        if self.partitions is not None:
+            return self.load_sales_partition(current_month())
+        with self.lock:
+            self._remember_sales()
+            if self.snapshot_dir and self.journal:
+                snapshot = read_sales_snapshot(self.snapshot_dir, self.sales_file, self.journal_file)
+                if snapshot is not None:
+                    sales_data, offset = snapshot
+                    return concat_sales(sales_data, sales_frame(self._read_journal(offset)))
+
+            frames = []
+            if os.path.exists(self.sales_file):
+                frames.append(pd.read_csv(self.sales_file, dtype={"Item ID": str}))
+            if self.journal:
+                frames.append(self._read_journal(0))
+
+        if frames:
+            return sales_frame(pd.concat(frames, ignore_index=True))
+        return sales_frame(pd.DataFrame(columns=SALES_COLUMNS))
+
+    def _tail_file(self):
+        # The file new sales are appended to
+        if self.partitions is not None:
+            return self.partitions.path(current_month())
+        return self.journal_file if self.journal else self.sales_file
+
+    def _remember_sales(self, path=None):
+        # After loading or rewriting sales: everything now in the files is known. Callers
+        # hold the lock.
+        path = path or self._tail_file()
+        self._tails[path] = os.path.getsize(path) if os.path.exists(path) else 0
+        self._own.pop(path, None)
+        self._sales_state = _file_state(self.sales_file)
+
+    def poll_sales(self):
+        # Sales other processes appended since the last load or poll, as (rows in the stored
+        # columns or None, reloaded). If the sales were rewritten instead (e.g. compacted by another
+        # instance) nothing is returned and reloaded is True: the caller has to load again.
+        if self.writer is not None:
+            self.writer.flush()
+        with self.lock:
+            path = self._tail_file()
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            offset = self._tails.get(path, 0)
+            if size < offset or (self.journal and self.partitions is None
+                                 and _file_state(self.sales_file) != self._sales_state):
+                return None, True
+            own = self._own.pop(path, [])
+            if size == offset:
+                return None, False
+            with open(path, "rb") as sales_file:
+                sales_file.seek(offset)
+                data = sales_file.read(size - offset)
+            self._tails[path] = size
+
+        # Skip the header line and the bytes this process appended itself
+        position = offset + data.find(b"\n") + 1 if offset == 0 else offset
+        chunks = []
+        for start, end in sorted(own):
+            if start > position:
+                chunks.append(data[position - offset:start - offset])
+            position = max(position, end)
+        chunks.append(data[position - offset:])
+        tail = b"".join(chunks)
+        if not tail.strip():
+            return None, False
+        return pd.read_csv(io.BytesIO(tail), header=None, names=SALES_COLUMNS, dtype={"Item ID": str}), False
+
+    def _read_journal(self, offset):
+        # Journal rows from byte `offset` on; offset 0 includes the header line
+        if not os.path.exists(self.journal_file) or os.path.getsize(self.journal_file) <= offset:
+            return pd.DataFrame(columns=SALES_COLUMNS)
+        with open(self.journal_file, "rb") as journal_file:
+            journal_file.seek(offset)
+            tail = journal_file.read()
+        if offset == 0:
+            return pd.read_csv(io.BytesIO(tail), dtype={"Item ID": str})
+        return pd.read_csv(io.BytesIO(tail), header=None, names=SALES_COLUMNS, dtype={"Item ID": str})
+
+    def sales_months(self):
+        # Months with sales, or None when the whole history is loaded at once
+        if self.partitions is None:
+            return None
+        with self.lock:
+            self.partitions.refresh()
+        return self.partitions.months()
+
+    def load_sales_partition(self, month):
+        if self.writer is not None:
+            # Queued appends or rewrites for the month have to be on disk first
+            self.writer.flush()
+        with self.lock:
+            self.partitions.refresh()
+            if month == current_month():
+                self._remember_sales(self.partitions.path(month))
+            return sales_frame(self.partitions.load(month))
+
+    def checkpoint_sales(self, sales_data):
+        if self.partitions is not None or not self.snapshot_dir or not self.journal:
+            return
+        snapshot = sales_data.copy()
+        self._submit(None, lambda: self._write_snapshot(snapshot), name="snapshot")
+
+    @timed
+    def _write_snapshot(self, sales_data):
+        # Everything appended so far has to be on disk before the journal offset is taken
+        if self._journal is not None:
+            self._journal.flush()
+        write_sales_snapshot(sales_data, self.snapshot_dir, self.sales_file, self.journal_file)
+
+    def append_sales(self, rows, sales_data):
+        if self.shared:
+            rows = [list(row) for row in rows]
+            self._submit(None, lambda: self._append_shared(rows), name="append_sales")
+            return
+        if self.partitions is not None:
+            rows = [list(row) for row in rows]
+            self._submit(None, lambda: self.partitions.append(rows), name="append_sales")
+            return
+        if not self.journal:
+            self._sales_snapshot = self._snapshot(sales_data)
+            self._submit("sales", self._write_sales)
+            return
+        rows = [list(row) for row in rows]
+        self._submit(None, lambda: self._append_journal(rows), name="append_sales")
+
+    @timed
+    def _write_sales(self):
+        write_csv_atomic(sales_records(self._sales_snapshot), self.sales_file)
+        self._remember_sales()
+
+    @timed
+    def _append_shared(self, rows):
+        # Shared mode: appends the rows (never rewrites) and remembers the bytes as this
+        # process's own, so poll_sales() doesn't read them back. Callers hold the lock.
+        # Returns a function that takes the rows out again.
+        if self.partitions is not None:
+            undo = self.partitions.append(rows)
+            appended = [(self.partitions.path(month), offset) for month, (offset, _) in undo.items()]
+        else:
+            self._close_journal()
+            path = self._tail_file()
+            appended = [(path, os.path.getsize(path) if os.path.exists(path) else 0)]
+            append_csv_rows(path, rows, self.durability)
+        for path, offset in appended:
+            self._own.setdefault(path, []).append((offset, os.path.getsize(path)))
+
+        def take_back():
+            if self.partitions is not None:
+                self.partitions.truncate(undo)
+            else:
+                with open(appended[0][0], "r+") as sales_file:
+                    sales_file.truncate(appended[0][1])
+            for path, _ in appended:
+                self._own[path].pop()
+        return take_back
+
+    @timed
+    def _append_journal(self, rows):
+        if self._journal is None:
+            write_header = not os.path.exists(self.journal_file) or os.path.getsize(self.journal_file) == 0
+            self._journal = open(self.journal_file, "a", newline="")
+            self._journal_writer = csv.writer(self._journal)
+            if write_header:
+                self._journal_writer.writerow(SALES_COLUMNS)
+
+        self._journal_writer.writerows(rows)
+        if self.durability != "none":
+            self._journal.flush()
+            if self.durability == "fsync":
+                os.fsync(self._journal.fileno())
+
+    def save_sales(self, sales_data):
+        # Rewrite the whole history; any journal is folded in, so it is discarded afterwards.
+        # In journal mode this runs in order with the appends and keeps its own snapshot,
+        # so sales appended after it was requested end up in the next journal.
+        # Partitioned sales only hold the loaded months, so just those months are rewritten.
+        if self.partitions is not None:
+            snapshot = self._snapshot(sales_data)
+            self._submit(None, lambda: self._write_partitions(snapshot), name="save_sales")
+            return
+        if not self.journal:
+            self._sales_snapshot = self._snapshot(sales_data)
+            self._submit("sales", self._write_sales)
+            return
+        snapshot = self._snapshot(sales_data)
+        self._submit(None, lambda: self._fold_journal(snapshot), name="save_sales")
+
+    @timed
+    def _fold_journal(self, sales_data):
+        self._close_journal()
+        write_csv_atomic(sales_records(sales_data), self.sales_file)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._remember_sales()
+
+    @timed
+    def _write_partitions(self, sales_data):
+        months = months_of(sales_data["Timestamp"])
+        for month, data in sales_records(sales_data).groupby(months, sort=True):
+            self.partitions.write(month, data)
+        self._remember_sales()
+
+    def compact_sales(self, sales_data):
+        # Month files are written directly, so there is nothing to fold
+        if self.partitions is None:
+            self.save_sales(sales_data)
+
+    @timed
+    def record_sales_batch(self, updates, rows, inventory_data, sales_data, lots):
+        # A checkout is stored now rather than on the background writer, so a failed write
+        # raises here and Sales.record_sales_batch can roll the sale back in memory. With a
+        # stock journal that only takes appends: the sale rows, then the new stock and lots
+        # of the items sold. The inventory and lots files are rewritten in the background
+        # like any other save.
+        rows = [list(row) for row in rows]
+        if self.stock_journal_file:
+            store_stock = lambda: self._append_stock(updates, lots)
+            # Queued inventory and lots writes don't touch the sales files
+            if self.writer is not None and self.writer.pending_besides(("inventory", "lots")):
+                self.writer.flush()
+        else:
+            self._inventory_snapshot = (inventory_data, self._stock_sequence)
+            store_stock = self._write_inventory
+            if self.writer is not None:
+                self.writer.flush()
+        with self.lock:
+            if self.shared:
+                # The stock is checked against the file, where other instances' sales show up
+                self._write_shared_batch(rows, updates)
+            elif self.partitions is not None:
+                self._write_partition_batch(rows, store_stock)
+            elif not self.journal:
+                self._sales_snapshot = sales_data
+                self._write_batch(store_stock)
+            else:
+                self._write_journal_batch(rows, store_stock)
+        try:
+            if self.stock_journal_file:
+                self.save_inventory(inventory_data)
+            self.update_lots(lots)
+        except Exception:
+            # The sale is stored; with a stock journal, so are its stock and lots until the
+            # next save
+            log.exception("Error saving data")
+
+    def _write_batch(self, store_stock):
+        sales_temp = self.sales_file + ".tmp"
+        sales_records(self._sales_snapshot).to_csv(sales_temp, index=False)
+        store_stock()
+        os.replace(sales_temp, self.sales_file)
+        self._remember_sales()
+
+    def _write_shared_batch(self, rows, updates):
+        take_back = self._append_shared(rows)
+        try:
+            self._merge_inventory(lambda stored: _take_stock(stored, rows, updates))
+        except Exception:
+            take_back()
+            raise
+
+    def _write_journal_batch(self, rows, store_stock):
+        # Stores a whole checkout or none of it: the sale rows go out in one journal write,
+        # and if the stock then can't be stored the journal is cut back to where it was
+        offset = os.path.getsize(self.journal_file) if os.path.exists(self.journal_file) else 0
+        self._append_journal(rows)
+        try:
+            store_stock()
+        except Exception:
+            self._close_journal()
+            with open(self.journal_file, "r+") as journal_file:
+                journal_file.truncate(offset)
+            raise
+
+    def _write_partition_batch(self, rows, store_stock):
+        # Same all-or-nothing rule as the journal batch, on the month files
+        undo = self.partitions.append(rows)
+        try:
+            store_stock()
+        except Exception:
+            self.partitions.truncate(undo)
+            raise
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+            self._journal_writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.shutdown()
+            self.writer = None
+        self._close_journal()
+
+
+def _set_item(stored, item_id, changes):
+    for column, value in changes.items():
+        stored.loc[stored["ID"] == item_id, column] = value
+    return stored
+
+
+def _receive_items(stored, top_ups, rows):
+    # Adds delivered quantities to the stored stock, keeping the earlier expiration date
+    if top_ups:
+        positions = pd.Index(stored["ID"]).get_indexer([item_id for item_id, _, _ in top_ups])
+        for (item_id, quantity, date), position in zip(top_ups, positions):
+            if position < 0:
+                # Deleted by another instance meanwhile; nothing to top up
+                continue
+            stored.iat[position, stored.columns.get_loc("Quantity")] = int(stored["Quantity"].iat[position]) + quantity
+            current = stored["Expiration Date"].iat[position]
+            if date and (not isinstance(current, str) or date < current):
+                stored.iat[position, stored.columns.get_loc("Expiration Date")] = date
+    if rows:
+        new = pd.DataFrame(rows, columns=INVENTORY_COLUMNS)
+        stored = pd.concat([stored[~stored["ID"].isin(new["ID"])], new], ignore_index=True)
+    return stored
+
+
+def _take_stock(stored, rows, updates):
+    # Takes the sold quantities off the stored stock, refusing to go below zero. The
+    # expiration dates come from updates, as the date of each item's first-expiring lot
+    # left after the sale.
+    sold = pd.DataFrame(rows, columns=SALES_COLUMNS).groupby("Item ID", sort=False)["Quantity"].sum()
+    positions = pd.Index(stored["ID"]).get_indexer(sold.index)
+    for item_id, position in zip(sold.index, positions):
+        if position < 0:
+            raise ValueError(f"Item ID '{item_id}' not found in inventory!")
+    quantities = stored["Quantity"].to_numpy()[positions] - sold.to_numpy()
+    for item_id, quantity in zip(sold.index, quantities):
+        if quantity < 0:
+            raise ValueError(f"Not enough stock available for item ID '{item_id}'!")
+    stored.iloc[positions, stored.columns.get_loc("Quantity")] = quantities
+    dates = {item_id: date for item_id, _, date in updates}
+    stored.iloc[positions, stored.columns.get_loc("Expiration Date")] = [dates[item_id] for item_id in sold.index]
+    return stored
+
+
+class SqliteStorage:
+    def __init__(self, database_file):
+        self.database_file = database_file
+        self.connection = sqlite3.connect(database_file, check_same_thread=False)
+        # WAL lets readers keep going while a sale is being written
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+
+    def create_tables(self):
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS inventory (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    expiration_date TEXT
+                );
+                CREATE INDEX IF NOT EXISTS inventory_name ON inventory (name);
+                CREATE INDEX IF NOT EXISTS inventory_expiration_date ON inventory (expiration_date);
+
+                CREATE TABLE IF NOT EXISTS sales (
+                    id INTEGER PRIMARY KEY,
+                    item_id TEXT NOT NULL,
+                    item_name TEXT,
+                    quantity INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    time TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS sales_item_id ON sales (item_id);
+                CREATE INDEX IF NOT EXISTS sales_date ON sales (date);
+
+                CREATE TABLE IF NOT EXISTS lots (
+                    item_id TEXT NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    expiration_date TEXT
+                );
+                CREATE INDEX IF NOT EXISTS lots_item_id ON lots (item_id);
+            """)
+
+    def load_inventory(self):
+        return inventory_frame(pd.read_sql_query(
+            'SELECT id AS "ID", name AS "Name", quantity AS "Quantity", '
+            'expiration_date AS "Expiration Date" FROM inventory ORDER BY rowid',
+            self.connection,
+            dtype={"ID": str},
+        ))
+
+    @timed
+    def save_inventory(self, data):
+        with self.connection:
+            self.connection.execute("DELETE FROM inventory")
+            self.connection.executemany(
+                "INSERT INTO inventory (id, name, quantity, expiration_date) VALUES (?, ?, ?, ?)",
+                _records(inventory_records(data)),
+            )
+
+    @timed
+    def insert_item(self, row, data):
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO inventory (id, name, quantity, expiration_date) VALUES (?, ?, ?, ?)",
+                _record(row),
+            )
+
+    @timed
+    def update_item(self, item_id, changes, data):
+        columns = {"Name": "name", "Quantity": "quantity", "Expiration Date": "expiration_date"}
+        assignments = ", ".join(f"{columns[column]} = ?" for column in changes)
+        with self.connection:
+            self.connection.execute(
+                f"UPDATE inventory SET {assignments} WHERE id = ?",
+                _record(list(changes.values()) + [item_id]),
+            )
+
+    @timed
+    def delete_item(self, item_id, data):
+        with self.connection:
+            self.connection.execute("DELETE FROM inventory WHERE id = ?", (item_id,))
+
+    def load_lots(self):
+        return pd.read_sql_query(
+            'SELECT item_id AS "Item ID", quantity AS "Quantity", expiration_date AS "Expiration Date" '
+            'FROM lots ORDER BY rowid',
+            self.connection,
+            dtype={"Item ID": str},
+        )
+
+    @timed
+    def update_lots(self, lots):
+        with self.connection:
+            self._replace_lots(lots)
+
+    def _replace_lots(self, lots):
+        # Callers hold the transaction
+        self.connection.executemany("DELETE FROM lots WHERE item_id = ?", [(item_id,) for item_id in lots])
+        self.connection.executemany(
+            "INSERT INTO lots (item_id, quantity, expiration_date) VALUES (?, ?, ?)",
+            [_record((item_id, quantity, date)) for item_id, item_lots in lots.items()
+             for quantity, date in item_lots],
+        )
+
+    @timed
+    def import_items(self, top_ups, rows, data):
+        # One transaction for the whole delivery
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE inventory SET quantity = quantity + ?, "
+                "expiration_date = MIN(COALESCE(expiration_date, ?), COALESCE(?, expiration_date)) WHERE id = ?",
+                [_record((quantity, date, date, item_id)) for item_id, quantity, date in top_ups],
+            )
+            self.connection.executemany(
+                "INSERT INTO inventory (id, name, quantity, expiration_date) VALUES (?, ?, ?, ?)",
+                [_record(row) for row in rows],
+            )
+
+    def load_sales(self):
+        return sales_frame(pd.read_sql_query(
+            'SELECT item_id AS "Item ID", item_name AS "Item Name", quantity AS "Quantity", '
+            'date AS "Date", time AS "Time" FROM sales ORDER BY id',
+            self.connection,
+            dtype={"Item ID": str},
+        ))
+
+    @timed
+    def append_sales(self, rows, sales_data):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO sales (item_id, item_name, quantity, date, time) VALUES (?, ?, ?, ?, ?)",
+                [_record(row) for row in rows],
+            )
+
+    @timed
+    def save_sales(self, sales_data):
+        with self.connection:
+            self.connection.execute("DELETE FROM sales")
+            self.connection.executemany(
+                "INSERT INTO sales (item_id, item_name, quantity, date, time) VALUES (?, ?, ?, ?, ?)",
+                _records(sales_records(sales_data)),
+            )
+
+    @timed
+    def compact_sales(self, sales_data):
+        # Rows are already stored individually; just fold the WAL back into the database
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    @timed
+    def record_sales_batch(self, updates, rows, inventory_data, sales_data, lots):
+        # One transaction for the stock changes, the lots left and the sale rows
+        with self.connection:
+            self._replace_lots(lots)
+            self.connection.executemany(
+                "UPDATE inventory SET quantity = ?, expiration_date = ? WHERE id = ?",
+                [_record((quantity, date, item_id)) for item_id, quantity, date in updates],
+            )
+            self.connection.executemany(
+                "INSERT INTO sales (item_id, item_name, quantity, date, time) VALUES (?, ?, ?, ?, ?)",
+                [_record(row) for row in rows],
+            )
+
+    def checkpoint_sales(self, sales_data):
+        # The database loads quickly by itself; nothing to snapshot
+        pass
+
+    def sales_months(self):
+        # Sales are loaded whole from the database
+        return None
+
+    def poll_inventory(self):
+        # The database does its own locking; other processes' changes are not followed
+        return None
+
+    def poll_sales(self):
+        return None, False
+
+    def load_sales_partition(self, month):
+        return sales_frame(pd.read_sql_query(
+            'SELECT item_id AS "Item ID", item_name AS "Item Name", quantity AS "Quantity", '
+            'date AS "Date", time AS "Time" FROM sales WHERE date LIKE ? ORDER BY id',
+            self.connection,
+            params=(month + "-%",),
+            dtype={"Item ID": str},
+        ))
+
+    def close(self):
+        self.connection.close()
+
+
+def _record(values):
+    # sqlite3 doesn't accept numpy scalars, so hand it plain Python values
+    return tuple(value.item() if hasattr(value, "item") else value for value in values)
+
+
+def _records(data):
+    return [_record(row) for row in data.itertuples(index=False, name=None)]
+
+
+def import_csv(database_file, inventory_file, sales_file, journal_file, lots_file=None, partition_dir=None,
+               stock_journal_file=None):
+    # Migrate the CSV files (including any unfolded sales journal and stock journal) into a SQLite database.
+    # If the sales have been split into monthly partitions, those hold the history instead.
+    if not partition_dir or not os.path.isdir(partition_dir):
+        partition_dir = None
+    source = CsvStorage(inventory_file, sales_file, journal_file, partition_dir=partition_dir, lots_file=lots_file,
+                        stock_journal_file=stock_journal_file)
+    target = SqliteStorage(database_file)
+    try:
+        inventory = source.load_inventory()
+        lots = source.load_lots()
+        lots["Item ID"] = lots["Item ID"].astype(str).str.strip()
+        target.save_inventory(inventory)
+        if partition_dir is None:
+            sales_data = source.load_sales()
+            target.save_sales(sales_data)
+            sales = len(sales_data)
+        else:
+            # A month at a time, so the whole history is never in memory
+            target.save_sales(sales_frame(pd.DataFrame(columns=SALES_COLUMNS)))
+            sales = 0
+            for month in source.sales_months():
+                month_sales = source.load_sales_partition(month)
+                target.append_sales(_records(sales_records(month_sales)), month_sales)
+                sales += len(month_sales)
+        lots = lots.astype(object).where(lots.notna(), None)
+        target.update_lots({item_id: list(zip(group["Quantity"], group["Expiration Date"]))
+                            for item_id, group in lots.groupby("Item ID", sort=False)})
+        return len(inventory), sales
+    finally:
+        target.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from models import (DATABASE_FILE, INVENTORY_FILE, LOTS_FILE, SALES_FILE, SALES_JOURNAL_FILE, SALES_PARTITION_DIR,
+                        STOCK_JOURNAL_FILE)
+
+    parser = argparse.ArgumentParser(description="Migrate the pharmacy CSV files into SQLite.")
+    parser.add_argument("--database", default=DATABASE_FILE)
+    parser.add_argument("--inventory", default=INVENTORY_FILE)
+    parser.add_argument("--sales", default=SALES_FILE)
+    parser.add_argument("--journal", default=SALES_JOURNAL_FILE)
+    parser.add_argument("--lots", default=LOTS_FILE)
+    parser.add_argument("--partitions", default=SALES_PARTITION_DIR)
+    parser.add_argument("--stock-journal", default=STOCK_JOURNAL_FILE)
+    args = parser.parse_args()
+
+    items, sales = import_csv(args.database, args.inventory, args.sales, args.journal, args.lots, args.partitions,
+                              args.stock_journal)
+    print(f"Imported {items} items and {sales} sales into {args.database}")
@@ -0,0 +1,27 @@
+# User accounts for the login screen. Kept apart from main, which imports pandas, so the
+# login window can check credentials before the data libraries are loaded (see startup.py).
+
+# Configurable default usernames and passwords
+DEFAULT_USERS = {
+    "admin": "admin",
+    "staff": "staff"
+}
+
+
+class UserManager:
+    def __init__(self):
+        self.users = {}  # username -> (password, role)
+        self.initialize_default_users()
+
+    def initialize_default_users(self):
+        for username, password in DEFAULT_USERS.items():
+            self.add_user(username, password, "admin" if username == "admin" else "staff")
+
+    def add_user(self, username, password, role):
+        self.users[username] = (password, role)
+
+    def authenticate(self, username, password):
+        user = self.users.get(username)
+        if user is not None and user[0] == password:
+            return user[1]
+        return None